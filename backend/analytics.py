@@ -0,0 +1,133 @@
+"""Vectorized analytics over energy, task, focus and metrics history
+
+Endpoints load the handful of fields they need with a projection, turn them
+into NumPy columns once with ``column``/``epochs`` and then compute every
+statistic on those arrays, so the cost of analyzing the full history is
+dominated by the database read rather than by Python loops over documents.
+Timestamps are expected as epoch milliseconds computed by the database (see
+``Repository.history`` in repositories.py), which avoids converting datetimes one by one.
+"""
+import numpy as np
+
+
+def column(docs, field, default=np.nan):
+    """Numeric column from a list of documents; missing values become default"""
+    values = np.array([doc.get(field) for doc in docs], dtype=float)
+    if not np.isnan(default):
+        values[np.isnan(values)] = default
+    return values
+
+
+def epochs(docs, field="epoch_ms"):
+    """POSIX timestamps in seconds from an epoch milliseconds field; NaN when missing"""
+    return column(docs, field) / 1000
+
+
+def hours(timestamps):
+    """UTC hour of day for POSIX timestamps, -1 where the timestamp is missing"""
+    result = np.full(timestamps.shape, -1, dtype=int)
+    valid = ~np.isnan(timestamps)
+    result[valid] = (timestamps[valid] // 3600 % 24).astype(int)
+    return result
+
+
+def summary(values):
+    """count, mean, variance, std, min and max, ignoring NaN"""
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return {"count": 0, "mean": None, "variance": None, "std": None, "min": None, "max": None}
+    return {
+        "count": int(values.size),
+        "mean": float(values.mean()),
+        "variance": float(values.var()),
+        "std": float(values.std()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+
+
+def rolling_mean(values, window):
+    """Trailing mean over window values; shorter than values by window - 1
+
+    A window containing NaN is NaN; the windows around it are unaffected.
+    """
+    if values.size < window or window < 1:
+        return np.empty(0)
+    valid = ~np.isnan(values)
+    sums = np.cumsum(np.insert(np.where(valid, values, 0.0), 0, 0.0))
+    counts = np.cumsum(np.insert(valid, 0, False))
+    means = (sums[window:] - sums[:-window]) / window
+    means[counts[window:] - counts[:-window] < window] = np.nan
+    return means
+
+
+def pooled_summary(counts, sums, sumsqs, mins=None, maxs=None):
+    """summary() of the union of pre-aggregated groups (count, sum, sum of squares per group)"""
+    count = counts.sum()
+    if count == 0:
+        return {"count": 0, "mean": None, "variance": None, "std": None, "min": None, "max": None}
+    mean = sums.sum() / count
+    variance = max(0.0, sumsqs.sum() / count - mean ** 2)
+    return {
+        "count": int(count),
+        "mean": float(mean),
+        "variance": float(variance),
+        "std": float(np.sqrt(variance)),
+        "min": float(np.nanmin(mins)) if mins is not None and mins.size else None,
+        "max": float(np.nanmax(maxs)) if maxs is not None and maxs.size else None,
+    }
+
+
+def hourly_totals(hour_of_day, counts, sums):
+    """Per-hour count and mean from grouped totals (NaN mean for hours without readings)"""
+    valid = (hour_of_day >= 0) & ~np.isnan(sums)
+    hour_counts = np.bincount(hour_of_day[valid], weights=counts[valid], minlength=24)
+    hour_sums = np.bincount(hour_of_day[valid], weights=sums[valid], minlength=24)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = hour_sums / hour_counts
+    return hour_counts, means
+
+
+def hourly_profile(hour_of_day, values):
+    """Reading count and mean value for each of the 24 hours (NaN mean without readings)"""
+    return hourly_totals(hour_of_day, np.ones(values.shape), values)
+
+
+def peak_hour(hour_of_day, values, min_readings=3):
+    """Hour of day with the highest mean value, or None without enough data"""
+    return peak_of_profile(*hourly_profile(hour_of_day, values), min_readings=min_readings)
+
+
+def peak_of_profile(counts, means, min_readings=3):
+    """Hour with the highest mean among hours with at least min_readings"""
+    means = np.where(counts >= min_readings, means, -np.inf)
+    if not np.isfinite(means).any():
+        return None
+    return int(np.argmax(means))
+
+
+def correlation(x, y):
+    """Pearson correlation, or None with fewer than 3 pairs or no variance"""
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+    if x.size < 3 or x.std() == 0 or y.std() == 0:
+        return None
+    return float(np.corrcoef(x, y)[0, 1])
+
+
+def energy_at(energy_times, energy_levels, times):
+    """Most recent energy level at or before each time (NaN before the first reading)"""
+    order = np.argsort(energy_times)
+    energy_times, energy_levels = energy_times[order], energy_levels[order]
+    positions = np.searchsorted(energy_times, times, side="right") - 1
+    result = np.full(times.shape, np.nan)
+    known = (positions >= 0) & ~np.isnan(times)
+    result[known] = energy_levels[positions[known]]
+    return result
+
+
+def energy_completion_correlation(energy_times, energy_levels, task_times, task_completed):
+    """Correlation between energy when a task was created and whether it got completed"""
+    if energy_times.size == 0 or task_times.size == 0:
+        return None
+    return correlation(energy_at(energy_times, energy_levels, task_times), task_completed)
@@ -0,0 +1,89 @@
+"""Stored Mongo document -> API dict conversion
+
+Every collection gets a DocumentCodec compiled once from its field plan:
+which fields hold datetimes (BSON dates, or ISO strings in documents written
+before the native datetime migration), which hold ObjectIds and which are
+internal. Decoding a document then touches only those fields instead of
+walking every value, and only fields declared as nested are descended into.
+"""
+from datetime import datetime
+
+from bson import ObjectId
+
+# Datetime fields per collection
+DATETIME_FIELDS = {
+    "energy_levels": ("timestamp",),
+    "tasks": ("created_at", "completed_at"),
+    "focus_sessions": ("started_at", "completed_at"),
+    "mood_states": ("timestamp",),
+    "productivity_metrics": ("timestamp",),
+    "work_environment": ("timestamp",),
+    "insights": ("timestamp",),
+    "biometric_data": ("timestamp",),
+    "streaks": ("last_updated",),
+}
+
+# Fields the API never returns: Mongo's _id, the owning user (implied by the
+# request) and values stored only to serve an index
+INTERNAL_FIELDS = ("_id", "user_id")
+COLLECTION_INTERNAL_FIELDS = {
+    "tasks": ("priority_rank",),
+}
+
+
+def parse_datetime(value):
+    """datetime from a legacy ISO string; other strings are returned unchanged"""
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return value
+
+
+def decode_value(value):
+    """Generic recursive conversion for values without a plan"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, dict):
+        value.pop("_id", None)
+        for key, item in value.items():
+            value[key] = decode_value(item)
+        return value
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+
+class DocumentCodec:
+    """Converts one collection's stored documents to API-ready dicts in place"""
+
+    def __init__(self, datetime_fields=(), object_id_fields=(), nested_fields=(), internal_fields=()):
+        self.internal_fields = INTERNAL_FIELDS + tuple(internal_fields)
+        self.datetime_fields = tuple(datetime_fields)
+        self.object_id_fields = tuple(object_id_fields)
+        self.nested_fields = tuple(nested_fields)
+
+    def decode(self, doc):
+        for key in self.internal_fields:
+            doc.pop(key, None)
+        for key in self.datetime_fields:
+            value = doc.get(key)
+            if value.__class__ is str:
+                doc[key] = parse_datetime(value)
+        for key in self.object_id_fields:
+            value = doc.get(key)
+            if value is not None:
+                doc[key] = str(value)
+        for key in self.nested_fields:
+            if key in doc:
+                doc[key] = decode_value(doc[key])
+        return doc
+
+    def decode_many(self, docs):
+        decode = self.decode
+        return [decode(doc) for doc in docs]
+
+
+CODECS = {
+    name: DocumentCodec(datetime_fields=fields, internal_fields=COLLECTION_INTERNAL_FIELDS.get(name, ()))
+    for name, fields in DATETIME_FIELDS.items()
+}
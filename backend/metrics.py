@@ -0,0 +1,109 @@
+"""In-process metrics rendered in the Prometheus text format
+
+Summaries keep a running count and sum plus a sliding window of the most recent
+observations, from which p50/p95/p99 are computed when /metrics is scraped, so
+recording an observation is O(1). Counters and gauges that other components
+already track in their own stats dicts are read at scrape time through
+collectors instead of being duplicated here.
+"""
+from collections import deque
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Summary:
+    """Count, sum and a window of recent observations"""
+
+    def __init__(self, window):
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantiles(self):
+        """Nearest-rank quantiles over the window (empty when nothing was observed)"""
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class Family:
+    """A metric name with one value per combination of label values"""
+
+    def __init__(self, name, help_text, kind, label_names=(), window=1024):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.window = window
+        self.children = {}
+
+    def observe(self, value, *label_values):
+        summary = self.children.get(label_values)
+        if summary is None:
+            summary = self.children[label_values] = Summary(self.window)
+        summary.observe(value)
+
+    def inc(self, *label_values, amount=1):
+        self.children[label_values] = self.children.get(label_values, 0) + amount
+
+    def samples(self):
+        """(suffix, labels, value) triples for the exposition format"""
+        for label_values, child in self.children.items():
+            labels = dict(zip(self.label_names, label_values))
+            if self.kind == "summary":
+                for q, value in child.quantiles().items():
+                    yield "", {**labels, "quantile": str(q)}, value
+                yield "_sum", labels, child.sum
+                yield "_count", labels, child.count
+            else:
+                yield "", labels, child
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _line(name, labels, value):
+    label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return f"{name}{{{label_text}}} {float(value)!r}" if label_text else f"{name} {float(value)!r}"
+
+
+class Registry:
+    def __init__(self, window=1024):
+        self.window = window
+        self.families = []
+        self.collectors = []
+
+    def summary(self, name, help_text, label_names=()):
+        family = Family(name, help_text, "summary", label_names, self.window)
+        self.families.append(family)
+        return family
+
+    def counter(self, name, help_text, label_names=()):
+        family = Family(name, help_text, "counter", label_names)
+        self.families.append(family)
+        return family
+
+    def collector(self, func):
+        """Register func() -> [(name, help, kind, [(labels, value), ...]), ...], called per scrape"""
+        self.collectors.append(func)
+        return func
+
+    def render(self):
+        lines = []
+        for family in self.families:
+            lines.append(f"# HELP {family.name} {family.help_text}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            lines.extend(_line(family.name + suffix, labels, value) for suffix, labels, value in family.samples())
+        for func in self.collectors:
+            for name, help_text, kind, samples in func():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(_line(name, labels, value) for labels, value in samples)
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,178 @@
+"""Per-collection read access with minimal projections
+
+Handlers used to fetch whole documents and then pick two or three fields out
+of them. Each repository here wraps one collection and only returns the fields
+the caller names, so the database ships and the driver decodes nothing else.
+Fields are checked against the collection's record type, which also documents
+what a document in that collection holds. Sort order (newest first on the
+collection's time field) and limits live here rather than at every call site.
+
+Repositories take the request-scoped ``db`` from server.py, so every query is
+confined to the current user like any other access through it.
+"""
+from datetime import datetime
+from typing import Optional, TypedDict
+
+
+class EnergyRecord(TypedDict, total=False):
+    id: str
+    level: int
+    timestamp: datetime
+    context: Optional[str]
+
+
+class TaskRecord(TypedDict, total=False):
+    id: str
+    title: str
+    description: Optional[str]
+    energy_requirement: int
+    estimated_duration: int
+    priority: str
+    priority_rank: int
+    category: Optional[str]
+    completed: bool
+    created_at: datetime
+    completed_at: Optional[datetime]
+
+
+class FocusSessionRecord(TypedDict, total=False):
+    id: str
+    task_id: Optional[str]
+    duration: int
+    energy_before: int
+    energy_after: Optional[int]
+    environment_type: str
+    productivity_rating: Optional[int]
+    started_at: datetime
+    completed_at: Optional[datetime]
+
+
+class MoodRecord(TypedDict, total=False):
+    id: str
+    mood: str
+    intensity: int
+    timestamp: datetime
+
+
+class MetricsRecord(TypedDict, total=False):
+    id: str
+    focus_duration: int
+    distraction_count: int
+    completion_confidence: int
+    difficulty_rating: int
+    timestamp: datetime
+
+
+class InsightRecord(TypedDict, total=False):
+    id: str
+    insight: str
+    category: str
+    timestamp: datetime
+
+
+class Repository:
+    """Projected, newest-first reads of one collection"""
+
+    collection_name = None
+    time_field = None
+    record = None
+
+    def __init__(self, db, history_limit=100000):
+        self.db = db
+        self.history_limit = history_limit
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    def projection(self, fields):
+        """Projection for exactly `fields`, rejecting names the record does not have"""
+        unknown = [field for field in fields if field not in self.record.__annotations__]
+        if unknown:
+            raise ValueError(f"{self.collection_name} has no field(s) {', '.join(unknown)}")
+        return {"_id": 0, **{field: 1 for field in fields}}
+
+    def base_query(self):
+        return {}
+
+    async def recent(self, fields, limit, query=None):
+        """The newest `limit` documents with only `fields`"""
+        return await self.collection.find(
+            {**self.base_query(), **(query or {})}, self.projection(fields)
+        ).sort(self.time_field, -1).limit(limit).to_list(limit)
+
+    async def count(self, query=None):
+        return await self.collection.count_documents({**self.base_query(), **(query or {})})
+
+    async def history(self, fields, query=None, limit=None):
+        """Newest-first read of `fields` for the analytics module, capped at `limit` or history_limit
+
+        The time field comes back as epoch_ms, converted by the server, ready
+        for analytics.epochs.
+        """
+        epoch_ms = {"$convert": {
+            "input": {"$convert": {"input": f"${self.time_field}", "to": "date", "onError": None, "onNull": None}},
+            "to": "long", "onError": None, "onNull": None
+        }}
+        projection = {**self.projection(fields), "epoch_ms": epoch_ms}
+        return await self.collection.find(
+            {**self.base_query(), **(query or {})}, projection
+        ).sort(self.time_field, -1).limit(limit or self.history_limit).to_list(None)
+
+
+class EnergyRepository(Repository):
+    collection_name = "energy_levels"
+    time_field = "timestamp"
+    record = EnergyRecord
+
+    async def levels(self, limit):
+        """The newest `limit` energy levels, newest first"""
+        return [doc["level"] for doc in await self.recent(["level"], limit)]
+
+
+class TaskRepository(Repository):
+    collection_name = "tasks"
+    time_field = "created_at"
+    record = TaskRecord
+
+    async def pending(self, fields):
+        """Every incomplete task, in no particular order"""
+        return await self.collection.find({"completed": False}, self.projection(fields)).to_list(None)
+
+    async def recommended(self, energy_levels, fields, limit):
+        """Incomplete tasks needing one of `energy_levels`, highest priority then oldest first
+
+        Listing the levels with $in lets the planner merge one sorted index
+        range per level instead of sorting every match in memory.
+        """
+        return await self.collection.find(
+            {"completed": False, "energy_requirement": {"$in": list(energy_levels)}}, self.projection(fields)
+        ).sort([("priority_rank", 1), ("created_at", 1)]).limit(limit).to_list(limit)
+
+
+class FocusSessionRepository(Repository):
+    collection_name = "focus_sessions"
+    time_field = "started_at"
+    record = FocusSessionRecord
+
+
+class MoodRepository(Repository):
+    collection_name = "mood_states"
+    time_field = "timestamp"
+    record = MoodRecord
+
+
+class MetricsRepository(Repository):
+    collection_name = "productivity_metrics"
+    time_field = "timestamp"
+    record = MetricsRecord
+
+
+class InsightRepository(Repository):
+    collection_name = "insights"
+    time_field = "timestamp"
+    record = InsightRecord
+
+    def base_query(self):
+        # The LLM response cache shares the collection; it is not user-facing
+        return {"category": {"$ne": "llm_cache"}}
@@ -0,0 +1,117 @@
+"""Energy-aware day planner
+
+Places pending tasks into time blocks so that each task starts when the
+predicted energy level covers its energy requirement for its whole duration.
+Tasks are kept in one heap per energy requirement (1-10), ordered by priority
+and then age; at each point in the day the planner only has to compare the
+heads of the heaps whose requirement the current energy can meet, so planning
+is O(n log n) in the number of tasks. Within a priority, the most demanding
+task the current energy allows goes first so peak hours are not spent on
+tasks that could run in a dip.
+"""
+import heapq
+from datetime import timedelta, timezone
+
+PRIORITY_RANKS = {"high": 0, "medium": 1, "low": 2}
+
+# Fallback energy per hour of day (1-10) following the circadian phase table
+DEFAULT_ENERGY_CURVE = [
+    2, 2, 2, 2, 2, 2,                  # 00-06 rest period
+    8.5, 8.5, 8.5, 8.5,                # 06-10 morning peak
+    6.5, 6.5, 6.5, 6.5,                # 10-14 mid-morning efficiency
+    4.5, 4.5,                          # 14-16 afternoon dip
+    5.5, 5.5, 5.5,                     # 16-19 second wind
+    3.5, 3.5, 3.5,                     # 19-22 evening wind-down
+    2, 2                               # 22-24 rest period
+]
+
+
+def _energy_at(curve, moment, zone):
+    return curve[moment.astimezone(zone).hour]
+
+
+def _min_energy(curve, start, minutes, zone):
+    """Lowest predicted energy over [start, start + minutes)"""
+    lowest = _energy_at(curve, start, zone)
+    # Step over the hours of the local clock, which need not begin on a UTC hour
+    hour_start = start.astimezone(zone).replace(minute=0, second=0, microsecond=0).astimezone(timezone.utc)
+    end = start + timedelta(minutes=minutes)
+    hour = hour_start + timedelta(hours=1)
+    while hour < end:
+        lowest = min(lowest, _energy_at(curve, hour, zone))
+        hour += timedelta(hours=1)
+    return lowest
+
+
+def plan_day(tasks, energy_curve, start, end, slot_minutes=15, break_minutes=5):
+    """Build a time-blocked plan between start and end
+
+    tasks are dicts with id, title, energy_requirement, estimated_duration,
+    priority and optionally priority_rank and created_at. energy_curve holds
+    the predicted energy for each hour of the day (24 values) on the clock of
+    start's time zone; block times are returned in that zone.
+    """
+    zone = start.tzinfo
+    # Step in UTC so durations stay exact across DST changes
+    start, end = start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+    heaps = {level: [] for level in range(1, 11)}
+    unscheduled = []
+    total_minutes = (end - start).total_seconds() / 60
+    for order, task in enumerate(tasks):
+        if task["estimated_duration"] > total_minutes:
+            unscheduled.append(task)
+            continue
+        rank = task.get("priority_rank", PRIORITY_RANKS.get(task["priority"], 1))
+        # Older tasks first within a priority; input order breaks remaining ties
+        created = task.get("created_at")
+        key = (rank, created.timestamp() if created else 0, order)
+        requirement = min(10, max(1, int(task["energy_requirement"])))
+        heapq.heappush(heaps[requirement], (key, task))
+
+    blocks = []
+    busy_minutes = 0
+    now = start
+    while now < end:
+        remaining = (end - now).total_seconds() / 60
+        energy = _energy_at(energy_curve, now, zone)
+        best = None
+        for level in range(1, min(10, int(energy)) + 1):
+            heap = heaps[level]
+            # Tasks too long for what is left of the day never fit later either
+            while heap and heap[0][1]["estimated_duration"] > remaining:
+                unscheduled.append(heapq.heappop(heap)[1])
+            if not heap:
+                continue
+            key, task = heap[0]
+            choice = (key[0], -level, key[1], key[2])
+            if best is not None and choice >= best:
+                continue
+            if _min_energy(energy_curve, now, task["estimated_duration"], zone) < level:
+                continue
+            best = choice
+        if best is None:
+            now += timedelta(minutes=slot_minutes)
+            continue
+
+        _, task = heapq.heappop(heaps[-best[1]])
+        finish = now + timedelta(minutes=task["estimated_duration"])
+        blocks.append({
+            "task_id": task["id"],
+            "title": task.get("title"),
+            "priority": task["priority"],
+            "energy_requirement": task["energy_requirement"],
+            "predicted_energy": round(_min_energy(energy_curve, now, task["estimated_duration"], zone), 1),
+            "start": now.astimezone(zone),
+            "end": finish.astimezone(zone)
+        })
+        busy_minutes += task["estimated_duration"]
+        now = finish + timedelta(minutes=break_minutes)
+
+    for heap in heaps.values():
+        unscheduled.extend(task for _, task in heap)
+    return {
+        "blocks": blocks,
+        "scheduled": len(blocks),
+        "unscheduled": [task["id"] for task in unscheduled],
+        "utilization": round(busy_minutes / total_minutes, 3) if total_minutes > 0 else 0.0
+    }
@@ -1,37 +1,292 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from emergentintegrations.llm.chat import LlmChat, UserMessage
+from scheduler import DEFAULT_ENERGY_CURVE, PRIORITY_RANKS, plan_day
+from bson import ObjectId
+import analytics
+import metrics
+from codec import CODECS, DATETIME_FIELDS
+import repositories
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import base64
+import contextvars
+import hashlib
+import hmac
+import httpx
 import json
+import time
+import zlib
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
+mongo_db = client[os.environ['DB_NAME']]
+
+# Metrics
+# Per-route request latency, Mongo operation latency (everything that goes
+# through `db`), Mongo operations per request and LLM call latency, served in
+# the Prometheus text format at /api/metrics. Quantiles cover the last
+# METRICS_WINDOW observations of each series.
+METRICS_WINDOW = int(os.environ.get('METRICS_WINDOW', '1024'))
+
+metrics_registry = metrics.Registry(window=METRICS_WINDOW)
+http_requests = metrics_registry.counter(
+    "zentask_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_duration = metrics_registry.summary(
+    "zentask_http_request_duration_seconds", "HTTP request latency until the response is complete", ("method", "route"))
+mongo_duration = metrics_registry.summary(
+    "zentask_mongo_operation_duration_seconds", "Mongo operation latency (cursor time included)", ("collection", "operation"))
+mongo_ops_per_request = metrics_registry.summary(
+    "zentask_mongo_operations_per_request", "Mongo operations issued while serving a request", ("method", "route"))
+llm_duration = metrics_registry.summary(
+    "zentask_llm_call_duration_seconds", "LLM completion latency once a concurrency slot is held", ("purpose",))
+
+# Mongo operations made by the current request, when there is one
+request_mongo_ops = contextvars.ContextVar("request_mongo_ops", default=None)
+
+def record_mongo(collection_name, operation, seconds):
+    """One Mongo operation: its latency, and one more for the current request's count"""
+    mongo_duration.observe(seconds, collection_name, operation)
+    ops = request_mongo_ops.get()
+    if ops is not None:
+        ops[0] += 1
+
+@contextmanager
+def timed_mongo(collection_name, operation):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_mongo(collection_name, operation, time.perf_counter() - started)
+
+class TimedCursor:
+    """Motor cursor wrapper that times the reads (to_list or async iteration)
+
+    A cursor is one operation however many documents or batches it returns.
+    When iterated, the time spent waiting on the cursor is summed and recorded
+    once it is exhausted, so time the caller spends between documents is not
+    counted; a cursor abandoned part way is not recorded.
+    """
+
+    def __init__(self, cursor, collection_name, operation):
+        self.cursor = cursor
+        self.collection_name = collection_name
+        self.operation = operation
+        self.elapsed = 0.0
+
+    def sort(self, *args, **kwargs):
+        self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, *args):
+        self.cursor.limit(*args)
+        return self
+
+    def skip(self, *args):
+        self.cursor.skip(*args)
+        return self
+
+    def batch_size(self, *args):
+        self.cursor.batch_size(*args)
+        return self
+
+    async def to_list(self, length):
+        with timed_mongo(self.collection_name, self.operation):
+            return await self.cursor.to_list(length)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        started = time.perf_counter()
+        try:
+            return await self.cursor.__anext__()
+        except StopAsyncIteration:
+            record_mongo(self.collection_name, self.operation, self.elapsed + time.perf_counter() - started)
+            raise
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+# Tenancy
+# Every document carries its owner's user_id and every read and write made
+# through `db` is scoped to the user of the current request, taken from the
+# X-User-Id header set by the gateway. Requests without the header act as
+# DEFAULT_USER_ID, which also owns data written before tenancy existed.
+# Cross-tenant maintenance (migrations, index builds, change streams, rebuilds)
+# goes through `mongo_db` directly.
+DEFAULT_USER_ID = os.environ.get('DEFAULT_USER_ID', 'default')
+USER_ID_PATTERN = "^[A-Za-z0-9_.@-]{1,128}$"
+
+current_user_id = contextvars.ContextVar("current_user_id", default=DEFAULT_USER_ID)
+
+@contextmanager
+def tenant(user_id):
+    """Run the enclosed block as user_id (for background work outside a request)"""
+    token = current_user_id.set(user_id)
+    try:
+        yield
+    finally:
+        current_user_id.reset(token)
+
+def scoped(query=None):
+    return {**(query or {}), "user_id": current_user_id.get()}
+
+class ScopedCollection:
+    """Motor collection wrapper that confines every operation to the current user"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def _stamp(self, doc):
+        doc.setdefault("user_id", current_user_id.get())
+        return doc
+
+    def find(self, filter=None, *args, **kwargs):
+        return TimedCursor(self.collection.find(scoped(filter), *args, **kwargs), self.collection.name, "find")
+
+    async def find_one(self, filter=None, *args, **kwargs):
+        with timed_mongo(self.collection.name, "find_one"):
+            return await self.collection.find_one(scoped(filter), *args, **kwargs)
+
+    async def count_documents(self, filter, **kwargs):
+        with timed_mongo(self.collection.name, "count_documents"):
+            return await self.collection.count_documents(scoped(filter), **kwargs)
+
+    def aggregate(self, pipeline, **kwargs):
+        cursor = self.collection.aggregate([{"$match": scoped()}, *pipeline], **kwargs)
+        return TimedCursor(cursor, self.collection.name, "aggregate")
+
+    async def insert_one(self, document, **kwargs):
+        with timed_mongo(self.collection.name, "insert_one"):
+            return await self.collection.insert_one(self._stamp(document), **kwargs)
+
+    async def insert_many(self, documents, **kwargs):
+        with timed_mongo(self.collection.name, "insert_many"):
+            return await self.collection.insert_many([self._stamp(doc) for doc in documents], **kwargs)
+
+    async def update_one(self, filter, update, **kwargs):
+        with timed_mongo(self.collection.name, "update_one"):
+            return await self.collection.update_one(scoped(filter), update, **kwargs)
+
+    async def update_many(self, filter, update, **kwargs):
+        with timed_mongo(self.collection.name, "update_many"):
+            return await self.collection.update_many(scoped(filter), update, **kwargs)
+
+    async def replace_one(self, filter, replacement, **kwargs):
+        with timed_mongo(self.collection.name, "replace_one"):
+            return await self.collection.replace_one(scoped(filter), self._stamp(replacement), **kwargs)
+
+    async def find_one_and_update(self, filter, update, **kwargs):
+        with timed_mongo(self.collection.name, "find_one_and_update"):
+            return await self.collection.find_one_and_update(scoped(filter), update, **kwargs)
+
+class TenantDB:
+    """Database handle whose collections are scoped to the current user"""
+
+    def __init__(self, database):
+        self.database = database
+
+    def __getitem__(self, name):
+        return ScopedCollection(self.database[name])
+
+    def __getattr__(self, name):
+        return ScopedCollection(self.database[name])
+
+db = TenantDB(mongo_db)
+
+async def bind_user(x_user_id: Optional[str] = Header(None, pattern=USER_ID_PATTERN)):
+    """Request dependency that scopes the handler's data access to the calling user"""
+    current_user_id.set(x_user_id or DEFAULT_USER_ID)
+
+# Cross-tenant maintenance endpoints (/api/admin) require the X-Admin-Token
+# header to match ADMIN_TOKEN; without ADMIN_TOKEN they are disabled.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+# Browsers cannot set headers on a WebSocket handshake, so /api/live also
+# accepts a short-lived token, issued over REST to the gateway-authenticated
+# user and signed with LIVE_TOKEN_SECRET (shared by every worker).
+LIVE_TOKEN_SECRET = os.environ.get('LIVE_TOKEN_SECRET')
+LIVE_TOKEN_TTL = float(os.environ.get('LIVE_TOKEN_TTL', '60'))
+
+def _live_token_signature(payload):
+    return hmac.new(LIVE_TOKEN_SECRET.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+def issue_live_token(user_id):
+    payload = base64.urlsafe_b64encode(json.dumps({"sub": user_id, "exp": time.time() + LIVE_TOKEN_TTL}).encode()).decode()
+    return f"{payload}.{_live_token_signature(payload)}"
+
+def verify_live_token(token):
+    """The user a live token was issued to, or None if it is forged, malformed or expired"""
+    if not LIVE_TOKEN_SECRET:
+        return None
+    payload, _, signature = token.partition(".")
+    if not hmac.compare_digest(signature, _live_token_signature(payload)):
+        return None
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except ValueError:
+        return None
+    return claims["sub"] if claims.get("exp", 0) > time.time() else None
+
+# Collections holding per-user documents, for the one-off assignment of
+# pre-tenancy data to DEFAULT_USER_ID
+TENANT_COLLECTIONS = (
+    "energy_levels", "tasks", "focus_sessions", "mood_states", "productivity_metrics",
+    "work_environment", "insights", "biometric_data", "streaks", "jobs"
+)
+# Derived collections are rebuilt rather than reassigned
+DERIVED_COLLECTIONS = ("stats_counters", "rollups_hourly", "rollups_daily", "circadian_model")
+
+async def assign_default_tenant():
+    """Give documents written before tenancy an owner; drop derived state keyed the old way"""
+    for name in TENANT_COLLECTIONS:
+        result = await mongo_db[name].update_many({"user_id": {"$exists": False}}, {"$set": {"user_id": DEFAULT_USER_ID}})
+        if result.modified_count:
+            logger.info(f"Assigned {result.modified_count} {name} documents to user '{DEFAULT_USER_ID}'")
+    for name in DERIVED_COLLECTIONS:
+        await mongo_db[name].delete_many({"user_id": {"$exists": False}})
+
+# How datetimes are persisted: "native" stores BSON dates, "iso" keeps the
+# legacy ISO-8601 strings. Reads accept both while old documents are migrated.
+DATETIME_STORAGE = os.environ.get('DATETIME_STORAGE', 'native')
 
 # Create the main app without a prefix
 app = FastAPI()
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", dependencies=[Depends(bind_user)])
 
-# AI Chat instance
-def get_ai_chat():
-    return LlmChat(
-        api_key=os.environ.get('EMERGENT_LLM_KEY'),
-        session_id="productivity_coach",
-        system_message="""You are an AI Productivity Coach specializing in energy-based task management. 
+# Cross-tenant maintenance, outside the per-user router
+admin_router = APIRouter(prefix="/api/admin", dependencies=[Depends(require_admin)])
+
+# AI Chat configuration
+AI_SYSTEM_MESSAGE = """You are an AI Productivity Coach specializing in energy-based task management. 
 
 Your expertise:
 - Analyze energy levels and suggest optimal task timing
@@ -41,7 +296,260 @@ Your expertise:
 - Give motivational coaching while maintaining productivity focus
 
 Keep responses concise, actionable, and encouraging. Focus on energy optimization and smart scheduling."""
-    ).with_model("openai", "gpt-4o-mini")
+
+LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'openai')
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gpt-4o-mini')
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))
+LLM_MAX_QUEUE = int(os.environ.get('LLM_MAX_QUEUE', '100'))
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', '60'))
+# Optional OpenAI-compatible endpoint (e.g. a proxy or a local fake server for
+# tests). When set, requests go over a shared keep-alive HTTP client instead
+# of the emergentintegrations LlmChat, which builds a new client per call and
+# so never reuses a connection.
+LLM_BASE_URL = os.environ.get('LLM_BASE_URL')
+
+# Response cache: identical prompts (after whitespace normalization) within the
+# TTL are answered from memory, and optionally from the insights collection
+# so other workers and restarts can reuse them.
+LLM_CACHE_TTL = float(os.environ.get('LLM_CACHE_TTL', '900'))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '512'))
+LLM_CACHE_MONGO = os.environ.get('LLM_CACHE_MONGO', 'false').lower() == 'true'
+
+# AI Chat instance
+def get_ai_chat(session_id="productivity_coach"):
+    return LlmChat(
+        api_key=os.environ.get('EMERGENT_LLM_KEY'),
+        session_id=session_id,
+        system_message=AI_SYSTEM_MESSAGE
+    ).with_model(LLM_PROVIDER, LLM_MODEL)
+
+class LLMResponseCache:
+    """TTL + LRU cache for LLM completions with an optional Mongo second tier"""
+
+    def __init__(self, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES, use_mongo=LLM_CACHE_MONGO):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.use_mongo = use_mongo
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "mongo_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(namespace, prompt):
+        normalized = " ".join(prompt.split())
+        return hashlib.sha256(f"{namespace}\0{normalized}".encode()).hexdigest()
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+            del self.entries[key]
+        if self.use_mongo:
+            cached = await db.insights.find_one(
+                {"cache_key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+                projection={"insight": 1, "expires_at": 1}
+            )
+            if cached:
+                self.stats["mongo_hits"] += 1
+                self._remember(key, cached["insight"], cached["expires_at"].timestamp())
+                return cached["insight"]
+        self.stats["misses"] += 1
+        return None
+
+    def _remember(self, key, value, expires_at):
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self.use_mongo:
+            now = datetime.now(timezone.utc)
+            await db.insights.update_one(
+                {"cache_key": key},
+                {"$set": {
+                    "insight": value,
+                    "category": "llm_cache",
+                    "timestamp": to_mongo_datetime(now),
+                    "expires_at": datetime.fromtimestamp(expires_at, timezone.utc)
+                }, "$setOnInsert": {"id": str(uuid.uuid4())}},
+                upsert=True
+            )
+
+class LLMClientPool:
+    """Shared LLM access with bounded concurrency and queueing metrics
+
+    At most max_concurrency completions are in flight at once; further callers
+    wait on the semaphore, and once max_queue callers are waiting new requests
+    are rejected with a 503 instead of piling up.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, max_queue=LLM_MAX_QUEUE, base_url=LLM_BASE_URL, cache=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.base_url = base_url
+        self.cache = cache
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.http = None
+        # Identical prompts already on their way to the model share one call
+        self.pending = {}
+        self.stats = {
+            "requests": 0,
+            "failures": 0,
+            "rejected": 0,
+            "in_flight": 0,
+            "queued": 0,
+            "max_queued": 0,
+            "wait_seconds_total": 0.0,
+            "call_seconds_total": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0
+        }
+
+    async def start(self):
+        if self.base_url and self.http is None:
+            api_key = os.environ.get('EMERGENT_LLM_KEY')
+            self.http = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {api_key}"} if api_key else None,
+                timeout=LLM_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            )
+
+    async def close(self):
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+    async def _complete_http(self, prompt):
+        response = await self.http.post(
+            "/chat/completions",
+            json={
+                "model": LLM_MODEL,
+                "messages": [
+                    {"role": "system", "content": AI_SYSTEM_MESSAGE},
+                    {"role": "user", "content": prompt}
+                ]
+            }
+        )
+        response.raise_for_status()
+        body = response.json()
+        usage = body.get("usage") or {}
+        self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        self.stats["completion_tokens"] += usage.get("completion_tokens", 0)
+        return body["choices"][0]["message"]["content"]
+
+    async def _complete_llm_chat(self, prompt, session_prefix):
+        # Every request gets its own session so conversations never bleed together
+        chat = get_ai_chat(session_id=f"{session_prefix}-{uuid.uuid4()}")
+        return await asyncio.wait_for(chat.send_message(UserMessage(text=prompt)), LLM_TIMEOUT_SECONDS)
+
+    async def send(self, prompt, session_prefix="productivity_coach", use_cache=True):
+        if not use_cache or self.cache is None:
+            return await self._send_uncached(prompt, session_prefix)
+        key = self.cache.make_key(session_prefix, prompt)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+        if key in self.pending:
+            return await asyncio.shield(self.pending[key])
+        future = asyncio.ensure_future(self._send_uncached(prompt, session_prefix))
+        self.pending[key] = future
+        try:
+            response = await asyncio.shield(future)
+        finally:
+            self.pending.pop(key, None)
+        await self.cache.set(key, response)
+        return response
+
+    @asynccontextmanager
+    async def _slot(self, purpose):
+        """Wait for a concurrency slot, tracking queue and call metrics"""
+        if self.stats["queued"] >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise HTTPException(status_code=503, detail="AI service is busy, please retry shortly")
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        self.stats["queued"] += 1
+        self.stats["max_queued"] = max(self.stats["max_queued"], self.stats["queued"])
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.stats["queued"] -= 1
+        started_at = loop.time()
+        self.stats["wait_seconds_total"] += started_at - queued_at
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        try:
+            yield
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        finally:
+            elapsed = loop.time() - started_at
+            self.stats["in_flight"] -= 1
+            self.stats["call_seconds_total"] += elapsed
+            llm_duration.observe(elapsed, purpose)
+            self.semaphore.release()
+
+    async def _send_uncached(self, prompt, session_prefix):
+        async with self._slot(session_prefix):
+            if self.http is not None:
+                return await self._complete_http(prompt)
+            return await self._complete_llm_chat(prompt, session_prefix)
+
+    async def _stream_http(self, prompt):
+        async with self.http.stream("POST", "/chat/completions", json={
+            "model": LLM_MODEL,
+            "stream": True,
+            "messages": [
+                {"role": "system", "content": AI_SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt}
+            ]
+        }) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                choices = json.loads(payload).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+    async def stream(self, prompt, session_prefix="productivity_coach"):
+        """Yield completion text as it arrives; the full text is cached at the end"""
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(session_prefix, prompt)
+            cached = await self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        parts = []
+        async with self._slot(session_prefix):
+            if self.http is not None:
+                async for delta in self._stream_http(prompt):
+                    parts.append(delta)
+                    yield delta
+            else:
+                # LlmChat has no token streaming, so the completion arrives in one piece
+                text = await self._complete_llm_chat(prompt, session_prefix)
+                parts.append(text)
+                yield text
+        if key is not None:
+            await self.cache.set(key, "".join(parts))
+
+llm_cache = LLMResponseCache()
+llm_pool = LLMClientPool(cache=llm_cache)
 
 # Define Models
 class EnergyLevel(BaseModel):
@@ -119,6 +627,14 @@ class MoodStateCreate(BaseModel):
     mood: str = Field(..., pattern="^(energetic|calm|focused|creative|stressed|tired|motivated)$")
     intensity: int = Field(..., ge=1, le=10)
 
+class WorkEnvironment(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    noise_level: int = Field(5, ge=1, le=10)
+    lighting_comfort: int = Field(5, ge=1, le=10)
+    workspace_comfort: int = Field(5, ge=1, le=10)
+    device_distractions: int = Field(5, ge=1, le=10)
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
 class ProductivityStreak(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     streak_type: str = Field(..., pattern="^(daily_energy|task_completion|focus_time|ai_interaction)$")
@@ -148,47 +664,1225 @@ class ProductivityInsight(BaseModel):
     category: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Index definitions
+# Every hot read path gets a named index so the planner never falls back to a
+# collection scan plus in-memory sort. Names are stable so reconciliation can
+# detect drift between what is declared here and what exists in the database.
+# All queries are scoped to one user, so every index except the TTL ones
+# (which must be single-field) leads with user_id.
+INDEX_SPECS = {
+    "energy_levels": [
+        {"name": "energy_id_unique", "keys": [("user_id", 1), ("id", 1)], "unique": True},
+        {"name": "energy_timestamp_desc", "keys": [("user_id", 1), ("timestamp", -1), ("id", -1)]},
+    ],
+    "mood_states": [
+        {"name": "mood_id_unique", "keys": [("user_id", 1), ("id", 1)], "unique": True},
+        {"name": "mood_timestamp_desc", "keys": [("user_id", 1), ("timestamp", -1)]},
+    ],
+    "tasks": [
+        {"name": "tasks_id_unique", "keys": [("user_id", 1), ("id", 1)], "unique": True},
+        {"name": "tasks_created_desc", "keys": [("user_id", 1), ("created_at", -1), ("id", -1)]},
+        {"name": "tasks_completed_created_desc", "keys": [("user_id", 1), ("completed", 1), ("created_at", -1), ("id", -1)]},
+        {"name": "tasks_recommended", "keys": [("user_id", 1), ("completed", 1), ("energy_requirement", 1), ("priority_rank", 1), ("created_at", 1)]},
+    ],
+    "focus_sessions": [
+        {"name": "focus_id_unique", "keys": [("user_id", 1), ("id", 1)], "unique": True},
+        {"name": "focus_started_desc", "keys": [("user_id", 1), ("started_at", -1)]},
+    ],
+    "productivity_metrics": [
+        {"name": "metrics_timestamp_desc", "keys": [("user_id", 1), ("timestamp", -1)]},
+    ],
+    "work_environment": [
+        {"name": "environment_timestamp_desc", "keys": [("user_id", 1), ("timestamp", -1)]},
+    ],
+    "insights": [
+        {"name": "insights_timestamp_desc", "keys": [("user_id", 1), ("timestamp", -1)]},
+        {"name": "insights_cache_key", "keys": [("user_id", 1), ("cache_key", 1)], "unique": True,
+         "partialFilterExpression": {"cache_key": {"$exists": True}}},
+        {"name": "insights_cache_expiry", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "biometric_data": [
+        {"name": "biometric_timestamp_desc", "keys": [("user_id", 1), ("timestamp", -1)]},
+    ],
+    "streaks": [
+        {"name": "streaks_user", "keys": [("user_id", 1), ("streak_type", 1)]},
+    ],
+    "jobs": [
+        {"name": "jobs_id_unique", "keys": [("user_id", 1), ("id", 1)], "unique": True},
+        {"name": "jobs_status", "keys": [("status", 1), ("lease_until", 1)]},
+        {"name": "jobs_active_dedupe", "keys": [("user_id", 1), ("dedupe_key", 1)], "unique": True,
+         "partialFilterExpression": {"active": True}},
+        {"name": "jobs_expiry", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ],
+    "rollups_hourly": [
+        {"name": "rollups_hourly_bucket", "keys": [("user_id", 1), ("bucket", 1)], "unique": True},
+    ],
+    "rollups_daily": [
+        {"name": "rollups_daily_bucket", "keys": [("user_id", 1), ("bucket", 1)], "unique": True},
+    ],
+    "rollups_journal": [
+        {"name": "rollups_journal_rebuild", "keys": [("rebuild_id", 1), ("_id", 1)]},
+    ],
+}
+
+# Recommended shard keys if the deployment is sharded. Every query carries
+# user_id, so it routes to the shard(s) owning that user. Each key matches a
+# unique index above (sharded unique indexes must start with the shard key),
+# and the second field lets a heavy user's documents split across chunks.
+SHARD_KEYS = {
+    "energy_levels": {"user_id": 1, "id": 1},
+    "mood_states": {"user_id": 1, "id": 1},
+    "tasks": {"user_id": 1, "id": 1},
+    "focus_sessions": {"user_id": 1, "id": 1},
+    "productivity_metrics": {"user_id": 1},
+    "insights": {"user_id": 1},
+    "rollups_hourly": {"user_id": 1, "bucket": 1},
+    "rollups_daily": {"user_id": 1, "bucket": 1},
+}
+
+# Which indexes each endpoint relies on, as (collection, index name) pairs
+ENDPOINT_INDEXES = {
+    "get_current_energy": [("energy_levels", "energy_timestamp_desc")],
+    "get_energy_history": [("energy_levels", "energy_timestamp_desc")],
+    "get_tasks": [("tasks", "tasks_created_desc"), ("tasks", "tasks_completed_created_desc")],
+    "get_today_schedule": [("tasks", "tasks_completed_created_desc"), ("rollups_hourly", "rollups_hourly_bucket")],
+    "complete_task": [("tasks", "tasks_id_unique")],
+    "get_recommended_tasks": [("energy_levels", "energy_timestamp_desc"), ("tasks", "tasks_recommended")],
+    "complete_focus_session": [("focus_sessions", "focus_id_unique")],
+    "get_ai_insight": [("energy_levels", "energy_timestamp_desc"), ("tasks", "tasks_created_desc"), ("focus_sessions", "focus_started_desc")],
+    "get_daily_summary": [("rollups_daily", "rollups_daily_bucket"), ("tasks", "tasks_created_desc")],
+    "get_productivity_analysis": [("rollups_daily", "rollups_daily_bucket")],
+    "get_dynamic_theme": [("mood_states", "mood_timestamp_desc"), ("energy_levels", "energy_timestamp_desc")],
+    "get_dashboard_stats": [("energy_levels", "energy_timestamp_desc"), ("focus_sessions", "focus_started_desc"), ("biometric_data", "biometric_timestamp_desc")],
+    "analyze_productivity_genetics": [("energy_levels", "energy_timestamp_desc"), ("tasks", "tasks_created_desc"), ("focus_sessions", "focus_started_desc")],
+    "predict_future_productivity": [("energy_levels", "energy_timestamp_desc"), ("tasks", "tasks_created_desc")],
+    "get_ai_mentor_session": [("energy_levels", "energy_timestamp_desc"), ("tasks", "tasks_created_desc"), ("mood_states", "mood_timestamp_desc"), ("insights", "insights_timestamp_desc")],
+    "generate_daily_challenges": [("energy_levels", "energy_timestamp_desc")],
+    "get_neural_network_data": [("energy_levels", "energy_timestamp_desc"), ("tasks", "tasks_created_desc")],
+    "generate_breakthrough_moment": [("energy_levels", "energy_timestamp_desc"), ("tasks", "tasks_created_desc"), ("focus_sessions", "focus_started_desc")],
+    "get_job": [("jobs", "jobs_id_unique")],
+    "analyze_productivity_patterns": [("rollups_hourly", "rollups_hourly_bucket"), ("energy_levels", "energy_timestamp_desc"), ("tasks", "tasks_created_desc"), ("focus_sessions", "focus_started_desc")],
+}
+
+# Result of the last reconciliation: (collection, index name) -> status
+index_status = {}
+
+# Index options that take part in drift detection
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+def _index_keys(keys):
+    """Normalize index_information() key specs (directions may come back as floats)"""
+    return [(field, int(direction) if isinstance(direction, (int, float)) else direction) for field, direction in keys]
+
+async def ensure_indexes():
+    """Create missing indexes and rebuild any whose definition has drifted"""
+    for collection_name, specs in INDEX_SPECS.items():
+        collection = mongo_db[collection_name]
+        existing = await collection.index_information()
+        for spec in specs:
+            name = spec["name"]
+            options = {option: spec[option] for option in INDEX_OPTIONS if option in spec}
+            current = existing.get(name)
+            if current and _index_keys(current["key"]) == spec["keys"] and all(
+                current.get(option) == spec.get(option) for option in INDEX_OPTIONS
+            ):
+                index_status[(collection_name, name)] = "ready"
+                continue
+            try:
+                if current:
+                    logger.info(f"Index {collection_name}.{name} changed definition, rebuilding")
+                    await collection.drop_index(name)
+                logger.info(f"Building index {collection_name}.{name} on {spec['keys']}")
+                started = datetime.now(timezone.utc)
+                await collection.create_index(spec["keys"], name=name, **options)
+                elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+                logger.info(f"Built index {collection_name}.{name} in {elapsed:.2f}s")
+                index_status[(collection_name, name)] = "ready"
+            except Exception as e:
+                logger.error(f"Failed to build index {collection_name}.{name}: {e}")
+                index_status[(collection_name, name)] = "failed"
+
+# One-shot migrations
+# Startup data migrations record their completion in the migrations collection
+# (_id is the migration name) so later startups and other workers skip them.
+# Each migration is idempotent, so workers racing on the very first startup
+# only repeat work, never corrupt it.
+async def run_once(name, migration):
+    """Run an idempotent startup migration unless it has already completed"""
+    if await mongo_db.migrations.count_documents({"_id": name}, limit=1):
+        return
+    started = time.perf_counter()
+    await migration()
+    await mongo_db.migrations.update_one(
+        {"_id": name},
+        {"$set": {"completed_at": datetime.now(timezone.utc), "seconds": round(time.perf_counter() - started, 2)}},
+        upsert=True
+    )
+    logger.info(f"Migration {name} completed")
+
+# Tasks store PRIORITY_RANKS[priority] as priority_rank next to the label,
+# since the labels themselves sort alphabetically (high < low < medium)
+async def backfill_priority_ranks():
+    """Give tasks written before priority_rank existed their rank"""
+    for priority, rank in PRIORITY_RANKS.items():
+        result = await mongo_db.tasks.update_many(
+            {"priority": priority, "priority_rank": {"$exists": False}},
+            {"$set": {"priority_rank": rank}}
+        )
+        if result.modified_count:
+            logger.info(f"Backfilled priority_rank on {result.modified_count} {priority} tasks")
+
+datetime_migration_status = {"state": "idle", "converted": {}, "skipped": {}}
+
 # Helper functions
+def to_mongo_datetime(value):
+    """Convert a datetime to its storage representation for the active mode"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    if DATETIME_STORAGE == "native":
+        return value
+    return value.isoformat()
+
 def prepare_for_mongo(data):
-    """Convert datetime objects to ISO strings for MongoDB storage"""
+    """Convert datetime objects to the configured storage format for MongoDB"""
     if isinstance(data, dict):
         for key, value in data.items():
             if isinstance(value, datetime):
-                data[key] = value.isoformat()
+                data[key] = to_mongo_datetime(value)
     return data
 
-def prepare_from_mongo(item):
-    """Convert MongoDB data back to Python objects if needed"""
-    if isinstance(item, dict):
-        # Convert ISO strings back to datetime if needed for processing
-        for key, value in item.items():
-            if isinstance(value, str) and key in ["timestamp", "created_at", "started_at", "completed_at"]:
+def since_filter(field, since):
+    """Range filter matching both native dates and legacy ISO strings"""
+    # BSON comparisons never cross types, so each representation needs its own
+    # branch; both are served by the same index.
+    return {"$or": [{field: {"$gte": since}}, {field: {"$gte": since.isoformat()}}]}
+
+def timestamp_text(value):
+    """Render a stored timestamp (BSON date or ISO string) as an ISO string"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+async def migrate_datetimes_to_native(batch_size=500):
+    """Rewrite ISO string timestamps as BSON dates in batches, safe to run online"""
+    datetime_migration_status.update({"state": "running", "converted": {}, "skipped": {}})
+    for collection_name, fields in DATETIME_FIELDS.items():
+        collection = mongo_db[collection_name]
+        for field in fields:
+            key = f"{collection_name}.{field}"
+            converted = skipped = 0
+            last_id = None
+            while True:
+                query = {field: {"$type": "string"}}
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                batch = await collection.find(query, {field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+                if not batch:
+                    break
+                last_id = batch[-1]["_id"]
+                operations = []
+                for doc in batch:
+                    try:
+                        parsed = datetime.fromisoformat(doc[field].replace('Z', '+00:00'))
+                    except ValueError:
+                        skipped += 1
+                        continue
+                    if parsed.tzinfo is None:
+                        parsed = parsed.replace(tzinfo=timezone.utc)
+                    # Match on the old value so concurrent writers are never clobbered
+                    operations.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: parsed}}))
+                if operations:
+                    result = await collection.bulk_write(operations, ordered=False)
+                    converted += result.modified_count
+                datetime_migration_status["converted"][key] = converted
+                datetime_migration_status["skipped"][key] = skipped
+                await asyncio.sleep(0)
+            if converted or skipped:
+                logger.info(f"Datetime migration {key}: {converted} converted, {skipped} skipped")
+    datetime_migration_status["state"] = "complete"
+    return datetime_migration_status
+
+async def save_insight(text, category):
+    """Persist an AI response to the insights collection"""
+    insight_obj = ProductivityInsight(insight=text, category=category)
+    await db.insights.insert_one(prepare_for_mongo(insight_obj.dict()))
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Event frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data, default=str)}\n\n"
+
+def stream_ai_response(request, prompt, session_prefix, insight_category):
+    """Forward LLM tokens as SSE and store the assembled text once complete
+
+    A client that disconnects stops the stream (and the upstream call) and
+    nothing is persisted for it.
+    """
+    async def events():
+        parts = []
+        try:
+            async for delta in llm_pool.stream(prompt, session_prefix=session_prefix):
+                if await request.is_disconnected():
+                    logger.info(f"Client disconnected from {session_prefix} stream")
+                    return
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+            text = "".join(parts)
+            await save_insight(text, insight_category)
+            yield sse_event({"text": text, "timestamp": datetime.now(timezone.utc)}, event="done")
+        except asyncio.CancelledError:
+            logger.info(f"{session_prefix} stream cancelled by client")
+            raise
+        except Exception as e:
+            yield sse_event({"detail": str(e)}, event="error")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Background jobs
+# Any worker process may run any job: a worker claims a queued job atomically
+# and holds a lease on it, renewed while the job runs. Jobs whose lease has
+# expired (their worker died) are queued again by whichever worker sweeps next,
+# up to JOB_MAX_ATTEMPTS runs.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_RESULT_TTL = float(os.environ.get('JOB_RESULT_TTL', '86400'))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '120'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+
+class JobQueue:
+    """Mongo-backed queue for slow AI analyses, run by in-process asyncio workers
+
+    Jobs are persisted in the jobs collection so their status and result can
+    be polled from any worker. Submitting a job identical to one that is
+    still queued or running returns the existing job instead of a new one;
+    the partial unique index on active jobs makes that hold across processes.
+    Jobs run as the user who submitted them.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = f"{os.uname().nodename}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.handlers = {}
+        self.queue = asyncio.Queue()
+        # Ids of jobs in the local queue, so a sweep does not queue them twice
+        self.enqueued = set()
+        self.tasks = []
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    async def start(self):
+        await self.recover()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self._recover_periodically()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def _enqueue(self, job):
+        if job["id"] not in self.enqueued:
+            self.enqueued.add(job["id"])
+            self.queue.put_nowait(job)
+
+    async def recover(self):
+        """Requeue jobs whose worker's lease ran out, then pick up every queued job"""
+        now = datetime.now(timezone.utc)
+        expired = {"status": "running", "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]}
+        await mongo_db.jobs.update_many(
+            {**expired, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": "failed", "error": "Worker stopped while running the job",
+                      "finished_at": now, "expires_at": now + timedelta(seconds=JOB_RESULT_TTL)},
+             "$unset": {"active": "", "owner": "", "lease_until": ""}}
+        )
+        requeued = await mongo_db.jobs.update_many(expired, {"$set": {"status": "queued"}, "$unset": {"owner": "", "lease_until": ""}})
+        if requeued.modified_count:
+            logger.info(f"Requeued {requeued.modified_count} jobs with expired leases")
+        async for job in mongo_db.jobs.find({"status": "queued"}, {"_id": 0}):
+            self._enqueue(job)
+
+    async def _recover_periodically(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds)
+            try:
+                await self.recover()
+            except Exception as e:
+                logger.error(f"Job recovery failed: {e}")
+
+    async def submit(self, kind, params=None):
+        params = params or {}
+        dedupe_key = hashlib.sha256(json.dumps([current_user_id.get(), kind, params], sort_keys=True).encode()).hexdigest()
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "params": params,
+            "status": "queued",
+            "active": True,
+            "attempts": 0,
+            "user_id": current_user_id.get(),
+            "dedupe_key": dedupe_key,
+            "created_at": datetime.now(timezone.utc)
+        }
+        try:
+            await db.jobs.insert_one(dict(job))
+        except DuplicateKeyError:
+            existing = await db.jobs.find_one({"dedupe_key": dedupe_key, "active": True}, {"id": 1})
+            if existing is not None:
+                return {"job_id": existing["id"], "deduplicated": True}
+            # The active job finished in between; this one is new after all
+            await db.jobs.insert_one(dict(job))
+        self._enqueue(job)
+        return {"job_id": job["id"], "deduplicated": False}
+
+    def _lease(self):
+        return datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)
+
+    async def _claim(self, job):
+        """Atomically take a queued job; None when another worker got it first"""
+        return await db.jobs.find_one_and_update(
+            {"id": job["id"], "status": "queued"},
+            {"$set": {"status": "running", "owner": self.owner, "lease_until": self._lease(),
+                      "started_at": datetime.now(timezone.utc)},
+             "$inc": {"attempts": 1}},
+            projection={"_id": 0}
+        )
+
+    async def _renew_lease(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await db.jobs.update_one(
+                    {"id": job_id, "owner": self.owner, "status": "running"},
+                    {"$set": {"lease_until": self._lease()}}
+                )
+            except Exception as e:
+                logger.warning(f"Could not renew the lease on job {job_id}: {e}")
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            self.enqueued.discard(job["id"])
+            token = current_user_id.set(job["user_id"])
+            try:
+                claimed = await self._claim(job)
+                if claimed is None:
+                    continue
+                renewal = asyncio.create_task(self._renew_lease(job["id"]))
+                update = {"status": "completed"}
                 try:
-                    item[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
-                except:
-                    pass  # Keep as string if conversion fails
-    return item
-
-def prepare_from_mongo(data):
-    """Convert MongoDB documents to JSON-serializable format"""
-    from bson import ObjectId
-    if isinstance(data, dict):
-        # Remove MongoDB's _id field or convert it to string
-        if '_id' in data:
-            del data['_id']
-        # Convert any ObjectId values to strings
-        for key, value in data.items():
-            if isinstance(value, ObjectId):
-                data[key] = str(value)
-            elif isinstance(value, list):
-                data[key] = [prepare_from_mongo(item) if isinstance(item, dict) else str(item) if isinstance(item, ObjectId) else item for item in value]
-            elif isinstance(value, dict):
-                data[key] = prepare_from_mongo(value)
-    elif isinstance(data, list):
-        return [prepare_from_mongo(item) if isinstance(item, dict) else str(item) if isinstance(item, ObjectId) else item for item in data]
-    elif isinstance(data, ObjectId):
-        return str(data)
-    return data
+                    update["result"] = await self.handlers[claimed["kind"]](**claimed["params"])
+                except HTTPException as e:
+                    update = {"status": "failed", "error": e.detail}
+                except Exception as e:
+                    update = {"status": "failed", "error": str(e)}
+                finally:
+                    renewal.cancel()
+                finished_at = datetime.now(timezone.utc)
+                update["finished_at"] = finished_at
+                update["expires_at"] = finished_at + timedelta(seconds=JOB_RESULT_TTL)
+                result = await db.jobs.update_one(
+                    {"id": job["id"], "owner": self.owner},
+                    {"$set": update, "$unset": {"active": "", "owner": "", "lease_until": ""}}
+                )
+                if result.matched_count == 0:
+                    logger.warning(f"Job {job['id']} lost its lease before finishing; result discarded")
+            except Exception as e:
+                logger.error(f"Job {job['id']} could not be recorded: {e}")
+            finally:
+                current_user_id.reset(token)
+                self.queue.task_done()
+
+job_queue = JobQueue()
+
+# Keyset pagination
+# List endpoints page on (sort field, id) in descending order. The cursor is an
+# opaque token holding the last item's sort value and id, so every page is a
+# bounded index walk no matter how deep the client has paged.
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '200'))
+
+def encode_cursor(sort_value, doc_id):
+    if isinstance(sort_value, datetime):
+        payload = ["d", sort_value.isoformat(), doc_id]
+    else:
+        payload = ["s", sort_value, doc_id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def decode_cursor(token):
+    try:
+        kind, value, doc_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if kind == "d":
+            value = datetime.fromisoformat(value)
+        return value, doc_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(field, cursor):
+    """Filter selecting everything after the cursor in (field, id) descending order"""
+    value, doc_id = decode_cursor(cursor)
+    clauses = [{field: {"$lt": value}}, {field: value, "id": {"$lt": doc_id}}]
+    if isinstance(value, datetime):
+        # Descending order puts BSON dates ahead of legacy ISO strings
+        clauses.append({field: {"$type": "string"}})
+    return {"$or": clauses}
+
+def parse_fields(fields, model, sort_field):
+    """Turn a comma separated field list into a projection; None means full documents"""
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    # The cursor needs the sort field and id even when the client did not ask for them
+    projection = {"_id": 0, "id": 1, sort_field: 1}
+    projection.update({f: 1 for f in requested})
+    return projection
+
+async def fetch_page(collection, query, sort_field, limit, cursor, projection):
+    """Fetch one keyset page; returns the documents and the next cursor (or None)"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        query = {**query, **keyset_filter(sort_field, cursor)}
+    docs = await collection.find(query, projection).sort([(sort_field, -1), ("id", -1)]).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1][sort_field], docs[-1]["id"])
+    return docs, next_cursor
+
+# Fast list responses
+# List endpoints project documents down to their model's fields, so what Motor
+# returns already has the API shape (no _id, user_id or internal fields). With
+# FAST_LIST_RESPONSES on, those dicts are encoded straight to bytes with orjson
+# instead of being rebuilt as models and walked by FastAPI's jsonable_encoder.
+FAST_LIST_RESPONSES = os.environ.get('FAST_LIST_RESPONSES', 'false').lower() == 'true'
+
+def model_projection(model):
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+def model_defaults(model):
+    """Values the model fills in for optional fields missing from older documents"""
+    return {
+        name: field.default for name, field in model.model_fields.items()
+        if not field.is_required() and field.default_factory is None
+    }
+
+def fast_list_response(docs, next_cursor, defaults=None):
+    """orjson response for projected documents, without per-item validation"""
+    if defaults:
+        docs = [{**defaults, **doc} for doc in docs]
+    return ORJSONResponse(docs, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+ENERGY_PROJECTION = model_projection(EnergyLevel)
+TASK_PROJECTION = model_projection(Task)
+TASK_DEFAULTS = model_defaults(Task)
+
+# Per-query timeout for QueryPlan reads, in seconds
+QUERY_TIMEOUT_SECONDS = float(os.environ.get('QUERY_TIMEOUT_SECONDS', '2.0'))
+
+class QueryPlan:
+    """Declare a handler's independent reads up front and run them concurrently
+
+    Each query gets its own timeout. A failed or timed-out optional query
+    resolves to its default so the endpoint can still answer with partial
+    data; a failed required query aborts the request with a 503.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or QUERY_TIMEOUT_SECONDS
+        self.queries = {}
+        self.failures = {}
+
+    def add(self, name, awaitable, default=None, timeout=None, required=False):
+        self.queries[name] = (awaitable, default, timeout or self.timeout, required)
+
+    async def _run_one(self, name):
+        awaitable, default, timeout, required = self.queries[name]
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except Exception as e:
+            reason = "timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+            logger.warning(f"Query '{name}' failed ({reason}), using default")
+            self.failures[name] = reason
+            return default
+
+    async def run(self):
+        names = list(self.queries)
+        results = await asyncio.gather(*(self._run_one(name) for name in names))
+        for name in names:
+            if name in self.failures and self.queries[name][3]:
+                raise HTTPException(status_code=503, detail=f"Query '{name}' failed: {self.failures[name]}")
+        return dict(zip(names, results))
+
+# Materialized counters
+# One stats_counters document per user (_id is the user id) is kept current
+# with $inc on every write so totals are O(1) lookups; reconcile_stats_counters
+# rebuilds it from the raw collections to correct any drift.
+COUNTERS_RECONCILE_INTERVAL = float(os.environ.get('COUNTERS_RECONCILE_INTERVAL', '3600'))
+
+def counter_increments(collection_name, docs):
+    """Counter deltas contributed by newly inserted documents"""
+    if collection_name == "tasks":
+        return {
+            "tasks_total": len(docs),
+            "tasks_completed": sum(1 for d in docs if d.get("completed"))
+        }
+    if collection_name == "energy_levels":
+        return {
+            "energy_logs": len(docs),
+            "energy_high": sum(1 for d in docs if d["level"] >= 8),
+            "energy_level_sum": sum(d["level"] for d in docs)
+        }
+    if collection_name == "focus_sessions":
+        return {"focus_sessions": len(docs)}
+    return {}
+
+async def increment_counters(increments):
+    increments = {key: value for key, value in increments.items() if value}
+    if increments:
+        await db.stats_counters.update_one({"_id": current_user_id.get()}, {"$inc": increments}, upsert=True)
+
+async def record_writes(collection_name, docs):
+    """Keep derived data in step with documents just inserted into a collection"""
+    await increment_counters(counter_increments(collection_name, docs))
+    await record_rollups("insert", collection_name, docs)
+    if collection_name == "energy_levels":
+        await circadian_model().record(docs)
+    latest_readings.observe(collection_name, docs)
+
+COUNTER_FIELDS = ("tasks_total", "tasks_completed", "energy_logs", "energy_high", "energy_level_sum", "focus_sessions")
+COUNTER_RECONCILE_ATTEMPTS = 3
+
+async def count_stats():
+    plan = QueryPlan(timeout=60)
+    plan.add("tasks_total", db.tasks.count_documents({}), required=True)
+    plan.add("tasks_completed", db.tasks.count_documents({"completed": True}), required=True)
+    plan.add("energy_logs", db.energy_levels.count_documents({}), required=True)
+    plan.add("energy_high", db.energy_levels.count_documents({"level": {"$gte": 8}}), required=True)
+    plan.add("energy_level_sum", db.energy_levels.aggregate([
+        {"$group": {"_id": None, "total": {"$sum": "$level"}}}
+    ]).to_list(1), required=True)
+    plan.add("focus_sessions", db.focus_sessions.count_documents({}), required=True)
+    counters = await plan.run()
+    counters["energy_level_sum"] = counters["energy_level_sum"][0]["total"] if counters["energy_level_sum"] else 0
+    return counters
+
+async def reconcile_stats_counters():
+    """Rebuild the current user's counters document from scratch
+
+    The recount only replaces the document if no $inc landed on it while the
+    collections were being counted (compare-and-set on the values read
+    beforehand), and is retried otherwise, so concurrent increments are never
+    overwritten.
+    """
+    user_id = current_user_id.get()
+    for _ in range(COUNTER_RECONCILE_ATTEMPTS):
+        before = await db.stats_counters.find_one({"_id": user_id}) or {}
+        counters = await count_stats()
+        counters["reconciled_at"] = datetime.now(timezone.utc)
+        try:
+            await db.stats_counters.replace_one(
+                {"_id": user_id, **{field: before.get(field) for field in COUNTER_FIELDS}},
+                dict(counters), upsert=True
+            )
+        except DuplicateKeyError:
+            # The document changed (or appeared) after it was read, so the upsert hit the existing _id
+            continue
+        logger.info(f"Reconciled stats counters for {user_id}: {counters}")
+        return {"_id": user_id, **counters}
+    logger.info(f"Stats counters for {user_id} kept changing; reconciliation deferred")
+    return {"_id": user_id, **counters}
+
+async def get_stats_counters():
+    counters = await db.stats_counters.find_one({"_id": current_user_id.get()})
+    if counters is None:
+        counters = await reconcile_stats_counters()
+    return counters
+
+async def reconcile_counters_periodically():
+    while True:
+        await asyncio.sleep(COUNTERS_RECONCILE_INTERVAL)
+        try:
+            for user_id in await mongo_db.stats_counters.distinct("_id"):
+                with tenant(user_id):
+                    await reconcile_stats_counters()
+        except Exception as e:
+            logger.error(f"Counter reconciliation failed: {e}")
+
+# Repositories
+# Handlers read energy, tasks, focus sessions, moods, metrics and insights
+# through these so every query names the fields it needs (see repositories.py).
+# Analytics endpoints read the full history of those fields, newest first,
+# capped at ANALYTICS_MAX_DOCS documents per collection. Analyses that only
+# need a representative window read the newest PATTERNS_SAMPLE_SIZE instead.
+ANALYTICS_MAX_DOCS = int(os.environ.get('ANALYTICS_MAX_DOCS', '100000'))
+PATTERNS_SAMPLE_SIZE = int(os.environ.get('PATTERNS_SAMPLE_SIZE', '2000'))
+
+energy_repo = repositories.EnergyRepository(db, history_limit=ANALYTICS_MAX_DOCS)
+tasks_repo = repositories.TaskRepository(db, history_limit=ANALYTICS_MAX_DOCS)
+focus_repo = repositories.FocusSessionRepository(db, history_limit=ANALYTICS_MAX_DOCS)
+mood_repo = repositories.MoodRepository(db, history_limit=ANALYTICS_MAX_DOCS)
+metrics_repo = repositories.MetricsRepository(db, history_limit=ANALYTICS_MAX_DOCS)
+insights_repo = repositories.InsightRepository(db, history_limit=ANALYTICS_MAX_DOCS)
+
+# Rollups
+# Hourly and daily buckets of energy, focus and metrics data, keyed by user and
+# bucket start (UTC) and maintained with $inc/$min/$max as documents are
+# written. Trend queries read a few hundred buckets instead of every raw
+# document; rebuild_rollups recomputes them from the raw collections.
+ROLLUP_COLLECTIONS = {"hour": "rollups_hourly", "day": "rollups_daily"}
+ROLLUP_ANALYSIS_DAYS = int(os.environ.get('ROLLUP_ANALYSIS_DAYS', '365'))
+
+# Source collection -> (timestamp field, rollup aggregation spec)
+ROLLUP_SOURCES = {
+    "energy_levels": ("timestamp", {
+        "energy_count": {"$sum": 1},
+        "energy_sum": {"$sum": "$level"},
+        "energy_sumsq": {"$sum": {"$multiply": ["$level", "$level"]}},
+        "energy_min": {"$min": "$level"},
+        "energy_max": {"$max": "$level"},
+    }),
+    "focus_sessions": ("started_at", {
+        "focus_sessions": {"$sum": 1},
+        "focus_minutes": {"$sum": "$duration"},
+        "rating_count": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$productivity_rating", None]}, None]}, 0, 1]}},
+        "rating_sum": {"$sum": {"$ifNull": ["$productivity_rating", 0]}},
+    }),
+    "productivity_metrics": ("timestamp", {
+        "metrics_count": {"$sum": 1},
+        "metrics_focus_minutes": {"$sum": "$focus_duration"},
+        "distraction_sum": {"$sum": "$distraction_count"},
+        "confidence_sum": {"$sum": "$completion_confidence"},
+    }),
+}
+
+def bucket_start(value, granularity):
+    moment = as_datetime(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    moment = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if granularity == "day" else moment
+
+def rollup_updates(collection_name, docs):
+    """Rollup update documents per granularity and bucket for newly inserted documents"""
+    if collection_name not in ROLLUP_SOURCES:
+        return {}
+    field = ROLLUP_SOURCES[collection_name][0]
+    updates = {}
+    for granularity in ROLLUP_COLLECTIONS:
+        buckets = updates.setdefault(granularity, {})
+        for doc in docs:
+            update = buckets.setdefault(bucket_start(doc[field], granularity), {"$inc": {}, "$min": {}, "$max": {}})
+            inc = update["$inc"]
+            if collection_name == "energy_levels":
+                level = doc["level"]
+                for key, value in (("energy_count", 1), ("energy_sum", level), ("energy_sumsq", level * level)):
+                    inc[key] = inc.get(key, 0) + value
+                update["$min"]["energy_min"] = min(update["$min"].get("energy_min", level), level)
+                update["$max"]["energy_max"] = max(update["$max"].get("energy_max", level), level)
+            elif collection_name == "focus_sessions":
+                rating = doc.get("productivity_rating")
+                for key, value in (("focus_sessions", 1), ("focus_minutes", doc["duration"]),
+                                   ("rating_count", 1 if rating is not None else 0), ("rating_sum", rating or 0)):
+                    inc[key] = inc.get(key, 0) + value
+            else:
+                for key, value in (("metrics_count", 1), ("metrics_focus_minutes", doc["focus_duration"]),
+                                   ("distraction_sum", doc["distraction_count"]),
+                                   ("confidence_sum", doc["completion_confidence"])):
+                    inc[key] = inc.get(key, 0) + value
+    return updates
+
+async def apply_rollups(updates):
+    for granularity, buckets in updates.items():
+        operations = [
+            UpdateOne(scoped({"bucket": bucket}), {op: fields for op, fields in update.items() if fields}, upsert=True)
+            for bucket, update in buckets.items()
+        ]
+        if operations:
+            with timed_mongo(ROLLUP_COLLECTIONS[granularity], "bulk_write"):
+                await mongo_db[ROLLUP_COLLECTIONS[granularity]].bulk_write(operations, ordered=False)
+
+# Online rebuilds
+# While a rebuild runs, every worker diverts its incremental rollup updates to
+# rollups_journal, one entry per raw document, instead of applying them. The
+# rebuild aggregates the raw collections into staging collections, renames
+# them over the live ones and replays the journal. Each staged bucket lists
+# the raw documents inserted (or rated) after the rebuild began that the
+# aggregation counted, and only journal entries for documents it did not count
+# are replayed, so no update is lost or counted twice. Workers keep journaling
+# for ROLLUP_JOURNAL_LINGER seconds after the rebuild ends to cover writes
+# whose raw insert happened before the swap.
+ROLLUP_STATE_TTL = float(os.environ.get('ROLLUP_STATE_TTL', '2'))
+ROLLUP_JOURNAL_LINGER = float(os.environ.get('ROLLUP_JOURNAL_LINGER', '30'))
+# A rebuild still marked running after this long is assumed to have crashed
+ROLLUP_REBUILD_TIMEOUT = timedelta(hours=1)
+# Allowance for clock skew between workers and slow inserts when deciding
+# which raw documents may have been journaled
+ROLLUP_CUTOFF_MARGIN = timedelta(minutes=5)
+
+# This process's view of the rollup_state document, refreshed every ROLLUP_STATE_TTL seconds
+rollup_rebuild_state = {"rebuild_id": None, "checked_at": float("-inf"), "seen_at": float("-inf"), "last_id": None}
+
+async def rollup_journal_id():
+    """Id of the rebuild whose journal incremental updates go to, or None to apply them directly"""
+    now = time.monotonic()
+    if now - rollup_rebuild_state["checked_at"] >= ROLLUP_STATE_TTL:
+        with timed_mongo("rollup_state", "find_one"):
+            state = await mongo_db.rollup_state.find_one({"_id": "rebuild"})
+        running = state is not None and state.get("running") and \
+            state["started_at"] > datetime.now(timezone.utc) - ROLLUP_REBUILD_TIMEOUT
+        rollup_rebuild_state["rebuild_id"] = state["rebuild_id"] if running else None
+        rollup_rebuild_state["checked_at"] = now
+    if rollup_rebuild_state["rebuild_id"] is not None:
+        rollup_rebuild_state["seen_at"] = now
+        rollup_rebuild_state["last_id"] = rollup_rebuild_state["rebuild_id"]
+    if now - rollup_rebuild_state["seen_at"] < ROLLUP_JOURNAL_LINGER:
+        return rollup_rebuild_state["last_id"]
+    return None
+
+async def record_rollups(kind, collection_name, docs, updates=None):
+    """Apply the rollup updates for raw documents just inserted ("insert") or rated ("rating")
+
+    updates defaults to rollup_updates(collection_name, docs); during a
+    rebuild they are journaled per document instead.
+    """
+    rebuild_id = await rollup_journal_id()
+    if rebuild_id is None:
+        await apply_rollups(updates if updates is not None else rollup_updates(collection_name, docs))
+        return
+    entries = []
+    for doc in docs:
+        doc_updates = updates if updates is not None else rollup_updates(collection_name, [doc])
+        for granularity, buckets in doc_updates.items():
+            for bucket, update in buckets.items():
+                entries.append({
+                    "rebuild_id": rebuild_id, "raw_id": doc["_id"], "kind": kind, "granularity": granularity,
+                    "user_id": current_user_id.get(), "bucket": bucket,
+                    # $-prefixed names cannot be stored, so "$inc" is kept as "inc"
+                    "update": {op[1:]: fields for op, fields in update.items() if fields}
+                })
+    if entries:
+        with timed_mongo("rollups_journal", "insert_many"):
+            await mongo_db.rollups_journal.insert_many(entries, ordered=False)
+
+def counted_fields(collection_name):
+    """Staging bucket fields listing the recent raw documents the rebuild counted"""
+    fields = {f"counted_{collection_name}": "insert"}
+    if collection_name == "focus_sessions":
+        fields["rated_focus_sessions"] = "rating"
+    return fields
+
+async def build_rollup_staging(granularity, cutoff):
+    """Aggregate every source collection into a fresh staging copy of a rollup collection
+
+    Returns the (kind, raw id) pairs of documents from after the cutoff that
+    the aggregation counted.
+    """
+    rollup_collection = ROLLUP_COLLECTIONS[granularity]
+    staging = mongo_db[f"{rollup_collection}_staging"]
+    await staging.drop()
+    # Same definition as the live index, so it carries over the rename unchanged
+    for spec in INDEX_SPECS[rollup_collection]:
+        await staging.create_index(spec["keys"], name=spec["name"], unique=spec.get("unique", False))
+    cutoff_id = ObjectId.from_datetime(cutoff)
+    for collection_name, (field, accumulators) in ROLLUP_SOURCES.items():
+        counted = counted_fields(collection_name)
+        recent = {f"counted_{collection_name}": {"$push": {"$cond": [{"$gte": ["$_id", cutoff_id]}, "$_id", "$$REMOVE"]}}}
+        if collection_name == "focus_sessions":
+            recent["rated_focus_sessions"] = {"$push": {"$cond": [{"$gte": ["$rated_at", cutoff]}, "$_id", "$$REMOVE"]}}
+        await mongo_db[collection_name].aggregate([
+            {"$project": {
+                "user_id": 1,
+                "at": {"$convert": {"input": f"${field}", "to": "date", "onError": None, "onNull": None}},
+                "rated_at": {"$convert": {"input": "$completed_at", "to": "date", "onError": None, "onNull": None}},
+                "level": 1, "duration": 1, "productivity_rating": 1,
+                "focus_duration": 1, "distraction_count": 1, "completion_confidence": 1
+            }},
+            {"$match": {"at": {"$ne": None}}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "bucket": {"$dateTrunc": {"date": "$at", "unit": granularity}}},
+                **accumulators,
+                **recent
+            }},
+            {"$project": {
+                "_id": 0, "user_id": "$_id.user_id", "bucket": "$_id.bucket",
+                **{name: 1 for name in accumulators}, **{name: 1 for name in counted}
+            }},
+            {"$merge": {"into": staging.name, "on": ["user_id", "bucket"], "whenMatched": "merge", "whenNotMatched": "insert"}}
+        ]).to_list(None)
+    fields = {name: kind for collection_name in ROLLUP_SOURCES for name, kind in counted_fields(collection_name).items()}
+    has_recent = {"$or": [{f"{name}.0": {"$exists": True}} for name in fields]}
+    counted = set()
+    async for bucket in staging.find(has_recent, {name: 1 for name in fields}):
+        for name, kind in fields.items():
+            counted.update((kind, raw_id) for raw_id in bucket.get(name, ()))
+    await staging.update_many(has_recent, {"$unset": {name: "" for name in fields}})
+    return counted
+
+async def replay_rollup_journal(rebuild_id, counted, batch_size=1000):
+    """Apply journaled updates for documents the rebuild did not count; returns how many"""
+    replayed = 0
+    while True:
+        entries = await mongo_db.rollups_journal.find({"rebuild_id": rebuild_id}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not entries:
+            return replayed
+        operations = {}
+        for entry in entries:
+            if (entry["kind"], entry["raw_id"]) in counted[entry["granularity"]]:
+                continue
+            operations.setdefault(entry["granularity"], []).append(UpdateOne(
+                {"user_id": entry["user_id"], "bucket": entry["bucket"]},
+                {f"${op}": fields for op, fields in entry["update"].items()},
+                upsert=True
+            ))
+        for granularity, batch in operations.items():
+            await mongo_db[ROLLUP_COLLECTIONS[granularity]].bulk_write(batch, ordered=False)
+            replayed += len(batch)
+        await mongo_db.rollups_journal.delete_many({"_id": {"$in": [entry["_id"] for entry in entries]}})
+
+async def rebuild_rollups():
+    """Recompute every user's rollup buckets from the raw collections, safe to run online"""
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    rebuild_id = str(uuid.uuid4())
+    try:
+        await mongo_db.rollup_state.update_one(
+            {"_id": "rebuild", "$or": [{"running": {"$ne": True}}, {"started_at": {"$lt": now - ROLLUP_REBUILD_TIMEOUT}}]},
+            {"$set": {"running": True, "rebuild_id": rebuild_id, "started_at": now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return {"state": "already running"}
+    rollup_rebuild_state["checked_at"] = float("-inf")
+    # Collections that were not swapped get every journaled update back
+    counted = {granularity: set() for granularity in ROLLUP_COLLECTIONS}
+    replayed = 0
+    failure = None
+    try:
+        # Entries left by an earlier rebuild that crashed describe writes this one recounts
+        await mongo_db.rollups_journal.delete_many({"rebuild_id": {"$ne": rebuild_id}})
+        # Every worker is journaling once it has re-read the state
+        await asyncio.sleep(ROLLUP_STATE_TTL + 1)
+        cutoff = now - ROLLUP_CUTOFF_MARGIN
+        for granularity, rollup_collection in ROLLUP_COLLECTIONS.items():
+            staged = await build_rollup_staging(granularity, cutoff)
+            await mongo_db[f"{rollup_collection}_staging"].rename(rollup_collection, dropTarget=True)
+            counted[granularity] = staged
+        replayed += await replay_rollup_journal(rebuild_id, counted)
+    except Exception as e:
+        logger.error(f"Rollup rebuild failed; rollups not yet swapped keep their previous buckets: {e}")
+        failure = e
+    finally:
+        await mongo_db.rollup_state.update_one({"_id": "rebuild", "rebuild_id": rebuild_id}, {"$set": {"running": False}})
+    rollup_rebuild_state["checked_at"] = float("-inf")
+    # Workers stop journaling ROLLUP_JOURNAL_LINGER seconds after they see the rebuild end
+    await asyncio.sleep(ROLLUP_STATE_TTL * 2 + ROLLUP_JOURNAL_LINGER + 1)
+    replayed += await replay_rollup_journal(rebuild_id, counted)
+    if failure is not None:
+        raise failure
+    counts = {name: await mongo_db[name].count_documents({}) for name in ROLLUP_COLLECTIONS.values()}
+    for user_id in await mongo_db.rollups_hourly.distinct("user_id"):
+        with tenant(user_id):
+            await rebuild_circadian_model()
+    circadian_models.clear()
+    logger.info(f"Rebuilt rollups in {time.perf_counter() - started:.1f}s: {counts}, {replayed} journaled updates replayed")
+    return {"buckets": counts, "replayed": replayed, "seconds": round(time.perf_counter() - started, 2)}
+
+async def ensure_rollups():
+    """Backfill rollups once when raw data predates them"""
+    if await mongo_db.rollups_daily.estimated_document_count() == 0 and await mongo_db.energy_levels.estimated_document_count() > 0:
+        await rebuild_rollups()
+
+async def read_rollups(granularity, days):
+    """The current user's rollup buckets covering the last `days` days, oldest first"""
+    since = bucket_start(datetime.now(timezone.utc), "day") - timedelta(days=days - 1)
+    return await db[ROLLUP_COLLECTIONS[granularity]].find({"bucket": {"$gte": since}}, {"_id": 0}).sort("bucket", 1).to_list(None)
+
+def rollup_energy_summary(buckets):
+    """summary() of energy readings across rollup buckets"""
+    return analytics.pooled_summary(
+        analytics.column(buckets, "energy_count", default=0),
+        analytics.column(buckets, "energy_sum", default=0),
+        analytics.column(buckets, "energy_sumsq", default=0),
+        analytics.column(buckets, "energy_min"),
+        analytics.column(buckets, "energy_max")
+    )
+
+def rollup_ratio(buckets, numerator, denominator):
+    """Sum of one rollup field over the sum of another, or None when the denominator is zero"""
+    total = analytics.column(buckets, denominator, default=0).sum()
+    return float(analytics.column(buckets, numerator, default=0).sum() / total) if total else None
+
+def rollup_hourly_profile(buckets):
+    """Reading count and mean energy for each hour of day (UTC) across hourly rollup buckets"""
+    hour_of_day = np.array([bucket["bucket"].hour for bucket in buckets], dtype=int)
+    return analytics.hourly_totals(
+        hour_of_day, analytics.column(buckets, "energy_count", default=0), analytics.column(buckets, "energy_sum", default=0)
+    )
+
+async def hourly_energy_profile(days):
+    """Reading count and mean energy for each hour of day (UTC) over the last `days` days"""
+    return rollup_hourly_profile(await read_rollups("hour", days))
+
+# Dashboard cache
+# Each user's assembled /dashboard/stats payload is cached per process and
+# dropped by every write endpoint that feeds it; the TTL bounds staleness for
+# writes made through other workers.
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', '30'))
+
+# user id -> {"value", "day", "expires_at"}
+dashboard_cache = {}
+dashboard_cache_stats = {"hits": 0, "misses": 0}
+
+def invalidate_dashboard_cache():
+    dashboard_cache.pop(current_user_id.get(), None)
+
+# Write-behind buffer
+# WRITE_BUFFER_MODE trades durability for write throughput on the energy and
+# mood logging endpoints:
+#   off          - insert_one on the request path (default)
+#   buffered     - acknowledge after validation; a crash loses at most one
+#                  flush interval of readings
+#   group_commit - coalesce concurrent writes but acknowledge only once the
+#                  batch holding the record has been written
+WRITE_BUFFER_MODE = os.environ.get('WRITE_BUFFER_MODE', 'off')
+WRITE_BUFFER_MAX_BATCH = int(os.environ.get('WRITE_BUFFER_MAX_BATCH', '200'))
+WRITE_BUFFER_FLUSH_SECONDS = float(os.environ.get('WRITE_BUFFER_FLUSH_SECONDS', '0.25'))
+
+def as_datetime(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return value
+
+class WriteBuffer:
+    """Coalesces inserts per collection and flushes them with insert_many"""
+
+    def __init__(self, mode=WRITE_BUFFER_MODE, max_batch=WRITE_BUFFER_MAX_BATCH, flush_seconds=WRITE_BUFFER_FLUSH_SECONDS):
+        self.mode = mode
+        self.max_batch = max_batch
+        self.flush_seconds = flush_seconds
+        self.pending = {}
+        self.locks = {}
+        self.task = None
+        # Size-triggered flushes, referenced until they finish
+        self.flushes = set()
+        self.stats = {"buffered": 0, "flushed": 0, "batches": 0, "failed": 0}
+
+    @property
+    def enabled(self):
+        return self.mode in ("buffered", "group_commit")
+
+    async def start(self):
+        if self.enabled:
+            self.task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await asyncio.gather(*self.flushes, return_exceptions=True)
+        await self.flush_all()
+
+    async def add(self, collection_name, doc):
+        """Queue a prepared document; in group_commit mode wait until it is written"""
+        done = asyncio.get_running_loop().create_future() if self.mode == "group_commit" else None
+        doc.setdefault("user_id", current_user_id.get())
+        batch = self.pending.setdefault(collection_name, [])
+        batch.append((doc, done))
+        self.stats["buffered"] += 1
+        if len(batch) >= self.max_batch:
+            flush = asyncio.create_task(self.flush(collection_name))
+            self.flushes.add(flush)
+            flush.add_done_callback(self._flush_done)
+        if done:
+            await done
+        else:
+            # Acknowledged records are visible to reads before they are flushed
+            latest_readings.observe(collection_name, [doc])
+
+    def _flush_done(self, flush):
+        self.flushes.discard(flush)
+        if not flush.cancelled() and flush.exception() is not None:
+            logger.error(f"Write buffer flush failed: {flush.exception()}")
+
+    def latest(self, collection_name):
+        """The current user's newest buffered document for a collection, by timestamp"""
+        user_id = current_user_id.get()
+        docs = [doc for doc, _ in self.pending.get(collection_name, ()) if doc["user_id"] == user_id]
+        if not docs:
+            return None
+        return max(docs, key=lambda doc: as_datetime(doc["timestamp"]))
+
+    def newest(self, collection_name, stored):
+        """Whichever of a stored document and the newest buffered one is more recent"""
+        buffered = self.latest(collection_name)
+        if buffered is None:
+            return stored
+        if stored is None or as_datetime(buffered["timestamp"]) >= as_datetime(stored["timestamp"]):
+            return buffered
+        return stored
+
+    async def flush(self, collection_name):
+        lock = self.locks.setdefault(collection_name, asyncio.Lock())
+        async with lock:
+            batch = self.pending.pop(collection_name, [])
+            if not batch:
+                return
+            docs = [doc for doc, _ in batch]
+            failed = {}
+            try:
+                # Documents already carry their user_id; one batch spans users
+                with timed_mongo(collection_name, "insert_many"):
+                    await mongo_db[collection_name].insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                failed = {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+            except Exception as e:
+                # Nothing was confirmed. Waiting writers get the error; acknowledged
+                # records go back in the buffer so the next flush retries them
+                logger.error(f"Write buffer flush to {collection_name} failed: {e}")
+                retry = []
+                for doc, done in batch:
+                    if done is None:
+                        retry.append((doc, done))
+                    elif not done.done():
+                        done.set_exception(HTTPException(status_code=503, detail="Write could not be committed"))
+                self.pending[collection_name] = retry + self.pending.get(collection_name, [])
+                return
+            written = []
+            for position, (doc, done) in enumerate(batch):
+                if position in failed:
+                    logger.error(f"Dropped buffered {collection_name} write {doc['id']}: {failed[position]}")
+                    if done and not done.done():
+                        done.set_exception(HTTPException(status_code=500, detail=failed[position]))
+                    continue
+                written.append(doc)
+                if done and not done.done():
+                    done.set_result(True)
+            self.stats["flushed"] += len(written)
+            self.stats["failed"] += len(failed)
+            self.stats["batches"] += 1
+        by_user = {}
+        for doc in written:
+            by_user.setdefault(doc["user_id"], []).append(doc)
+        for user_id, docs in by_user.items():
+            # The documents are already stored, so a failed derived update is only logged
+            with tenant(user_id):
+                try:
+                    await record_writes(collection_name, docs)
+                except Exception as e:
+                    logger.error(f"Recording buffered {collection_name} writes for {user_id} failed: {e}")
+                invalidate_dashboard_cache()
+
+    async def flush_all(self):
+        for collection_name in list(self.pending):
+            await self.flush(collection_name)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush_all()
+            except Exception as e:
+                logger.error(f"Write buffer flush failed: {e}")
+
+write_buffer = WriteBuffer()
+
+# Latest readings
+# Each user's newest energy and mood documents are read on nearly every page
+# load, so they are kept in a process-local cache updated by the write path. Writes made
+# by other workers show up after LATEST_CACHE_TTL seconds, or immediately when
+# LATEST_CACHE_CHANGE_STREAM is on (requires a replica set).
+LATEST_CACHE_TTL = float(os.environ.get('LATEST_CACHE_TTL', '5'))
+LATEST_CACHE_CHANGE_STREAM = os.environ.get('LATEST_CACHE_CHANGE_STREAM', 'false').lower() == 'true'
+LATEST_CACHE_MAX_ENTRIES = int(os.environ.get('LATEST_CACHE_MAX_ENTRIES', '10000'))
+
+class LatestReadingCache:
+    """Newest document per user and time series collection"""
+
+    def __init__(self, collections=("energy_levels", "mood_states"), ttl=LATEST_CACHE_TTL, max_entries=LATEST_CACHE_MAX_ENTRIES):
+        self.collections = collections
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (user id, collection) -> (doc, loaded_at), oldest load first
+        self.entries = OrderedDict()
+        self.locks = {}
+        self.watching = False
+        self.task = None
+        self.stats = {"hits": 0, "loads": 0}
+
+    def _fresh(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and (self.watching or time.monotonic() - entry[1] < self.ttl)
+
+    async def get(self, collection_name):
+        """The current user's newest document in a collection"""
+        key = (current_user_id.get(), collection_name)
+        if not self._fresh(key):
+            lock = self.locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                if not self._fresh(key):
+                    stored = await db[collection_name].find_one(sort=[("timestamp", -1)], projection={"_id": 0})
+                    self.entries.pop(key, None)
+                    self.entries[key] = (write_buffer.newest(collection_name, stored), time.monotonic())
+                    self.stats["loads"] += 1
+                    while len(self.entries) > self.max_entries:
+                        evicted, _ = self.entries.popitem(last=False)
+                        self.locks.pop(evicted, None)
+                    return self.entries[key][0]
+        self.stats["hits"] += 1
+        return self.entries[key][0]
+
+    def observe(self, collection_name, docs):
+        """Fold newly written documents into their owners' loaded entries"""
+        for doc in docs:
+            key = (doc.get("user_id", current_user_id.get()), collection_name)
+            entry = self.entries.get(key)
+            if entry is None:
+                # Never loaded: the database query decides what is newest
+                continue
+            latest, loaded_at = entry
+            if latest is None or as_datetime(doc["timestamp"]) >= as_datetime(latest["timestamp"]):
+                self.entries[key] = ({k: v for k, v in doc.items() if k != "_id"}, loaded_at)
+
+    def invalidate(self):
+        self.entries.clear()
+
+    async def start(self):
+        if LATEST_CACHE_CHANGE_STREAM:
+            self.task = asyncio.create_task(self._follow_changes())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _follow_changes(self):
+        pipeline = [{"$match": {"operationType": "insert", "ns.coll": {"$in": list(self.collections)}}}]
+        while True:
+            try:
+                async with mongo_db.watch(pipeline) as stream:
+                    # Entries loaded before the stream opened may have missed writes
+                    self.invalidate()
+                    self.watching = True
+                    async for change in stream:
+                        self.observe(change["ns"]["coll"], [change["fullDocument"]])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Latest reading change stream unavailable, falling back to TTL: {e}")
+            self.watching = False
+            await asyncio.sleep(30)
+
+latest_readings = LatestReadingCache()
 
 # Energy Management Routes
 @api_router.post("/energy", response_model=EnergyLevel)
@@ -196,20 +1890,30 @@ async def log_energy_level(energy_data: EnergyLevelCreate):
     energy_dict = energy_data.dict()
     energy_obj = EnergyLevel(**energy_dict)
     energy_mongo = prepare_for_mongo(energy_obj.dict())
+    if write_buffer.enabled:
+        await write_buffer.add("energy_levels", energy_mongo)
+        return energy_obj
     await db.energy_levels.insert_one(energy_mongo)
+    await record_writes("energy_levels", [energy_mongo])
+    invalidate_dashboard_cache()
     return energy_obj
 
 @api_router.get("/energy/current")
 async def get_current_energy():
-    latest_energy = await db.energy_levels.find_one(sort=[("timestamp", -1)])
+    latest_energy = await latest_readings.get("energy_levels")
     if not latest_energy:
         return {"level": 5, "message": "No energy data found. Default level set to 5."}
     return {"level": latest_energy["level"], "context": latest_energy.get("context")}
 
 @api_router.get("/energy/history")
-async def get_energy_history(limit: int = 20):
-    energy_history = await db.energy_levels.find().sort("timestamp", -1).limit(limit).to_list(limit)
-    return [prepare_from_mongo(energy) for energy in energy_history]
+async def get_energy_history(response: Response, limit: int = 20, cursor: Optional[str] = None, fields: Optional[str] = None):
+    projection = parse_fields(fields, EnergyLevel, "timestamp") or ENERGY_PROJECTION
+    energy_history, next_cursor = await fetch_page(db.energy_levels, {}, "timestamp", limit, cursor, projection)
+    if FAST_LIST_RESPONSES:
+        return fast_list_response(energy_history, next_cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return CODECS["energy_levels"].decode_many(energy_history)
 
 # Task Management Routes
 @api_router.post("/tasks", response_model=Task)
@@ -217,48 +1921,66 @@ async def create_task(task_data: TaskCreate):
     task_dict = task_data.dict()
     task_obj = Task(**task_dict)
     task_mongo = prepare_for_mongo(task_obj.dict())
+    task_mongo["priority_rank"] = PRIORITY_RANKS[task_obj.priority]
     await db.tasks.insert_one(task_mongo)
+    await record_writes("tasks", [task_mongo])
+    invalidate_dashboard_cache()
     return task_obj
 
 @api_router.get("/tasks", response_model=List[Task])
-async def get_tasks(completed: Optional[bool] = None):
+async def get_tasks(response: Response, completed: Optional[bool] = None, limit: int = 100, cursor: Optional[str] = None, fields: Optional[str] = None):
+    """List tasks newest first; follow X-Next-Cursor to fetch the next page"""
     filter_dict = {}
     if completed is not None:
         filter_dict["completed"] = completed
     
-    tasks = await db.tasks.find(filter_dict).sort("created_at", -1).to_list(100)
+    projection = parse_fields(fields, Task, "created_at")
+    tasks, next_cursor = await fetch_page(db.tasks, filter_dict, "created_at", limit, cursor, projection or TASK_PROJECTION)
+    if FAST_LIST_RESPONSES:
+        return fast_list_response(tasks, next_cursor, None if projection else TASK_DEFAULTS)
+    if projection:
+        # Partial tasks cannot satisfy the response model, so they skip it
+        return JSONResponse(
+            jsonable_encoder(CODECS["tasks"].decode_many(tasks)),
+            headers={"X-Next-Cursor": next_cursor} if next_cursor else None
+        )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return [Task(**task) for task in tasks]
 
 @api_router.patch("/tasks/{task_id}/complete")
 async def complete_task(task_id: str):
+    # Only the first completion counts, so repeated calls leave the counters alone
     result = await db.tasks.update_one(
-        {"id": task_id},
+        {"id": task_id, "completed": {"$ne": True}},
         {
             "$set": {
                 "completed": True,
-                "completed_at": datetime.now(timezone.utc).isoformat()
+                "completed_at": to_mongo_datetime(datetime.now(timezone.utc))
             }
         }
     )
     if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Task not found")
+        if not await db.tasks.count_documents({"id": task_id}, limit=1):
+            raise HTTPException(status_code=404, detail="Task not found")
+        return {"message": "Task completed successfully"}
+    await increment_counters({"tasks_completed": 1})
+    invalidate_dashboard_cache()
     return {"message": "Task completed successfully"}
 
 @api_router.get("/tasks/recommended")
 async def get_recommended_tasks():
     # Get current energy level
-    current_energy = await db.energy_levels.find_one(sort=[("timestamp", -1)])
+    current_energy = await latest_readings.get("energy_levels")
     energy_level = current_energy["level"] if current_energy else 5
     
-    # Get pending tasks that match energy level (±2 range)
-    tasks = await db.tasks.find({
-        "completed": False,
-        "energy_requirement": {"$gte": max(1, energy_level - 2), "$lte": min(10, energy_level + 2)}
-    }).sort("priority", 1).limit(5).to_list(5)
+    # Get pending tasks that match energy level (±2 range), highest priority first
+    energy_levels = range(max(1, energy_level - 2), min(10, energy_level + 2) + 1)
+    tasks = await tasks_repo.recommended(energy_levels, list(Task.model_fields), 5)
     
     return {
         "current_energy": energy_level,
-        "recommended_tasks": [prepare_from_mongo(task) for task in tasks],
+        "recommended_tasks": CODECS["tasks"].decode_many(tasks),
         "message": f"Tasks optimized for your current energy level ({energy_level}/10)"
     }
 
@@ -269,22 +1991,32 @@ async def start_focus_session(session_data: FocusSessionCreate):
     session_obj = FocusSession(**session_dict)
     session_mongo = prepare_for_mongo(session_obj.dict())
     await db.focus_sessions.insert_one(session_mongo)
+    await record_writes("focus_sessions", [session_mongo])
+    invalidate_dashboard_cache()
     return session_obj
 
 @api_router.patch("/focus-sessions/{session_id}/complete")
 async def complete_focus_session(session_id: str, energy_after: int, productivity_rating: int):
-    result = await db.focus_sessions.update_one(
+    previous = await db.focus_sessions.find_one_and_update(
         {"id": session_id},
         {
             "$set": {
                 "energy_after": energy_after,
                 "productivity_rating": productivity_rating,
-                "completed_at": datetime.now(timezone.utc).isoformat()
+                "completed_at": to_mongo_datetime(datetime.now(timezone.utc))
             }
-        }
+        },
+        projection={"started_at": 1, "productivity_rating": 1}
     )
-    if result.modified_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Focus session not found")
+    # The rating lands in the rollup bucket of the session's start
+    previous_rating = previous.get("productivity_rating")
+    rating_change = {"rating_count": 0 if previous_rating is not None else 1, "rating_sum": productivity_rating - (previous_rating or 0)}
+    await record_rollups("rating", "focus_sessions", [previous], {
+        granularity: {bucket_start(previous["started_at"], granularity): {"$inc": rating_change}}
+        for granularity in ROLLUP_COLLECTIONS
+    })
     return {"message": "Focus session completed"}
 
 @api_router.get("/focus-sessions/stats")
@@ -304,52 +2036,59 @@ async def get_focus_stats():
     }
 
 # AI Coaching Routes
+async def build_insight_prompt(request):
+    # Get user's recent data for context
+    plan = QueryPlan()
+    plan.add("energy", energy_repo.recent(["level", "timestamp", "context"], 5), default=[])
+    plan.add("tasks", tasks_repo.recent(["title", "energy_requirement", "completed"], 5), default=[])
+    plan.add("sessions", focus_repo.recent(["duration", "productivity_rating"], 3), default=[])
+    results = await plan.run()
+    recent_energy = results["energy"]
+    recent_tasks = results["tasks"]
+    recent_sessions = results["sessions"]
+    
+    # Clean the data for JSON serialization
+    recent_energy = CODECS["energy_levels"].decode_many(recent_energy)
+    recent_tasks = CODECS["tasks"].decode_many(recent_tasks)
+    recent_sessions = CODECS["focus_sessions"].decode_many(recent_sessions)
+    
+    context_data = {
+        "recent_energy_levels": recent_energy,
+        "recent_tasks": [{"title": t["title"], "energy_requirement": t["energy_requirement"], "completed": t["completed"]} for t in recent_tasks],
+        "recent_focus_sessions": [{"duration": s["duration"], "productivity_rating": s.get("productivity_rating")} for s in recent_sessions]
+    }
+    
+    ai_prompt = f"""
+    User Question: {request.question}
+    
+    User Context Data: {json.dumps(context_data, indent=2, default=str)}
+    
+    Additional Context: {request.context or 'None provided'}
+    
+    Please provide a personalized, actionable response based on their productivity patterns and current energy data.
+    """
+    return ai_prompt
+
 @api_router.post("/ai/insight")
 async def get_ai_insight(request: AIInsightRequest):
     try:
-        # Get user's recent data for context
-        recent_energy = await db.energy_levels.find().sort("timestamp", -1).limit(5).to_list(5)
-        recent_tasks = await db.tasks.find().sort("created_at", -1).limit(5).to_list(5)
-        recent_sessions = await db.focus_sessions.find().sort("started_at", -1).limit(3).to_list(3)
-        
-        # Clean the data for JSON serialization
-        recent_energy = [prepare_from_mongo(energy) for energy in recent_energy]
-        recent_tasks = [prepare_from_mongo(task) for task in recent_tasks]
-        recent_sessions = [prepare_from_mongo(session) for session in recent_sessions]
-        
-        context_data = {
-            "recent_energy_levels": recent_energy,
-            "recent_tasks": [{"title": t["title"], "energy_requirement": t["energy_requirement"], "completed": t["completed"]} for t in recent_tasks],
-            "recent_focus_sessions": [{"duration": s["duration"], "productivity_rating": s.get("productivity_rating")} for s in recent_sessions]
-        }
-        
-        ai_prompt = f"""
-        User Question: {request.question}
-        
-        User Context Data: {json.dumps(context_data, indent=2)}
-        
-        Additional Context: {request.context or 'None provided'}
-        
-        Please provide a personalized, actionable response based on their productivity patterns and current energy data.
-        """
-        
-        chat = get_ai_chat()
-        user_message = UserMessage(text=ai_prompt)
-        response = await chat.send_message(user_message)
+        ai_prompt = await build_insight_prompt(request)
+        response = await llm_pool.send(ai_prompt, session_prefix="insight")
         
         # Store insight
-        insight_obj = ProductivityInsight(
-            insight=response,
-            category="ai_coaching"
-        )
-        insight_mongo = prepare_for_mongo(insight_obj.dict())
-        await db.insights.insert_one(insight_mongo)
+        await save_insight(response, "ai_coaching")
         
         return {"insight": response, "timestamp": datetime.now(timezone.utc)}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI insight failed: {str(e)}")
 
+@api_router.post("/ai/insight/stream")
+async def stream_ai_insight(request: AIInsightRequest, http_request: Request):
+    """Stream the coaching insight as Server-Sent Events"""
+    ai_prompt = await build_insight_prompt(request)
+    return stream_ai_response(http_request, ai_prompt, "insight", "ai_coaching")
+
 @api_router.get("/ai/daily-summary")
 async def get_daily_summary():
     try:
@@ -357,19 +2096,21 @@ async def get_daily_summary():
         today = datetime.now(timezone.utc).date()
         today_start = datetime.combine(today, datetime.min.time()).replace(tzinfo=timezone.utc)
         
-        today_energy = await db.energy_levels.find({
-            "timestamp": {"$gte": today_start.isoformat()}
-        }).to_list(100)
-        
-        today_tasks = await db.tasks.find({
-            "created_at": {"$gte": today_start.isoformat()}
-        }).to_list(100)
+        plan = QueryPlan()
+        plan.add("today", db.rollups_daily.find_one({"bucket": today_start}), default=None)
+        plan.add("tasks", tasks_repo.history(["completed"], since_filter("created_at", today_start)), default=[])
+        results = await plan.run()
+        today_rollup = results["today"] or {}
+        energy = rollup_energy_summary([today_rollup] if today_rollup else [])
+        completed = analytics.column(results["tasks"], "completed", default=0)
         
         summary_data = {
-            "energy_readings": len(today_energy),
-            "avg_energy": sum(e["level"] for e in today_energy) / len(today_energy) if today_energy else 0,
-            "tasks_created": len(today_tasks),
-            "tasks_completed": len([t for t in today_tasks if t["completed"]])
+            "energy_readings": energy["count"],
+            "avg_energy": energy["mean"] or 0,
+            "energy_range": [energy["min"], energy["max"]] if energy["count"] else None,
+            "focus_minutes": today_rollup.get("focus_minutes", 0),
+            "tasks_created": int(completed.size),
+            "tasks_completed": int(completed.sum())
         }
         
         ai_prompt = f"""
@@ -379,9 +2120,7 @@ async def get_daily_summary():
         Provide insights, patterns, and suggestions for tomorrow. Keep it encouraging and actionable.
         """
         
-        chat = get_ai_chat()
-        user_message = UserMessage(text=ai_prompt)
-        summary = await chat.send_message(user_message)
+        summary = await llm_pool.send(ai_prompt, session_prefix="daily_summary")
         
         return {"summary": summary, "data": summary_data}
         
@@ -397,36 +2136,35 @@ async def log_productivity_metrics(metrics: ProductivityMetricsCreate):
     metrics_obj = ProductivityMetrics(**metrics_dict)
     metrics_mongo = prepare_for_mongo(metrics_obj.dict())
     await db.productivity_metrics.insert_one(metrics_mongo)
+    await record_writes("productivity_metrics", [metrics_mongo])
     return metrics_obj
 
 @api_router.get("/productivity-analysis")
 async def get_productivity_analysis():
     """Real productivity analysis based on actual user data"""
-    # Get recent metrics
-    recent_metrics = await db.productivity_metrics.find().sort("timestamp", -1).limit(10).to_list(10)
+    # Recent metrics, task completion data and energy patterns are independent
+    plan = QueryPlan()
+    plan.add("days", read_rollups("day", ROLLUP_ANALYSIS_DAYS), default=[])
+    plan.add("counters", get_stats_counters(), default={})
+    results = await plan.run()
+    days = results["days"]
+    total_tasks = results["counters"].get("tasks_total", 0)
+    completed_tasks = results["counters"].get("tasks_completed", 0)
     
-    # Get task completion data
-    total_tasks = await db.tasks.count_documents({})
-    completed_tasks = await db.tasks.count_documents({"completed": True})
-    
-    # Get energy patterns
-    recent_energy = await db.energy_levels.find().sort("timestamp", -1).limit(20).to_list(20)
-    
-    # Calculate real insights
-    if recent_metrics:
-        avg_focus_duration = sum(m["focus_duration"] for m in recent_metrics) / len(recent_metrics)
-        avg_distractions = sum(m["distraction_count"] for m in recent_metrics) / len(recent_metrics)
-        avg_confidence = sum(m["completion_confidence"] for m in recent_metrics) / len(recent_metrics)
-    else:
-        avg_focus_duration = 45
-        avg_distractions = 3
-        avg_confidence = 7
+    # Calculate real insights over the daily rollups
+    avg_focus_duration = rollup_ratio(days, "metrics_focus_minutes", "metrics_count") or 45
+    avg_distractions = rollup_ratio(days, "distraction_sum", "metrics_count")
+    avg_distractions = 3 if avg_distractions is None else avg_distractions
+    avg_confidence = rollup_ratio(days, "confidence_sum", "metrics_count") or 7
     
     completion_rate = (completed_tasks / max(total_tasks, 1)) * 100
     
-    if recent_energy:
-        avg_energy = sum(e["level"] for e in recent_energy) / len(recent_energy)
-        energy_consistency = 10 - (max(e["level"] for e in recent_energy) - min(e["level"] for e in recent_energy))
+    energy = rollup_energy_summary(days)
+    recent_energy = rollup_energy_summary(days[-7:])
+    if energy["count"]:
+        avg_energy = recent_energy["mean"] if recent_energy["count"] else energy["mean"]
+        # Two standard deviations either side roughly spans the old min-max range
+        energy_consistency = max(0.0, 10 - 4 * energy["std"])
     else:
         avg_energy = 5
         energy_consistency = 5
@@ -481,14 +2219,18 @@ async def log_mood_state(mood: MoodStateCreate):
     mood_dict = mood.dict()
     mood_obj = MoodState(**mood_dict)
     mood_mongo = prepare_for_mongo(mood_obj.dict())
+    if write_buffer.enabled:
+        await write_buffer.add("mood_states", mood_mongo)
+        return mood_obj
     await db.mood_states.insert_one(mood_mongo)
+    await record_writes("mood_states", [mood_mongo])
     return mood_obj
 
 @api_router.get("/mood/theme")
 async def get_dynamic_theme():
     """Get UI theme based on current mood and energy"""
-    current_mood = await db.mood_states.find_one(sort=[("timestamp", -1)])
-    current_energy = await db.energy_levels.find_one(sort=[("timestamp", -1)])
+    current_mood = await latest_readings.get("mood_states")
+    current_energy = await latest_readings.get("energy_levels")
     
     energy_level = current_energy["level"] if current_energy else 5
     mood = current_mood["mood"] if current_mood else "calm"
@@ -526,10 +2268,11 @@ async def get_productivity_streaks():
             streak_obj = ProductivityStreak(**streak_data)
             streak_mongo = prepare_for_mongo(streak_obj.dict())
             await db.streaks.insert_one(streak_mongo)
+        invalidate_dashboard_cache()
         
         streaks = await db.streaks.find().to_list(100)
     
-    return [prepare_from_mongo(streak) for streak in streaks]
+    return CODECS["streaks"].decode_many(streaks)
 
 @api_router.post("/voice-command")
 async def process_voice_command(command: dict):
@@ -577,10 +2320,138 @@ async def process_voice_command(command: dict):
             "action": {"type": "help"}
         }
 
+# Circadian model
+# Energy statistics for each of the 168 hours of the week (UTC), per user. Every
+# reading updates the in-process model with Welford's streaming mean/variance
+# and is $inc'ed into the user's circadian_model document (_id is the user id);
+# workers reload that document every CIRCADIAN_MODEL_TTL seconds to pick up
+# each other's readings. Answers only touch the fixed-size model, never the raw
+# readings. At most CIRCADIAN_MAX_MODELS users' models are kept in memory.
+CIRCADIAN_MODEL_TTL = float(os.environ.get('CIRCADIAN_MODEL_TTL', '300'))
+CIRCADIAN_MAX_MODELS = int(os.environ.get('CIRCADIAN_MAX_MODELS', '1000'))
+CIRCADIAN_MIN_READINGS = 3
+CIRCADIAN_WINDOW_HOURS = 2
+HOURS_PER_WEEK = 168
+
+def hour_of_week(moment):
+    moment = as_datetime(moment)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    moment = moment.astimezone(timezone.utc)
+    return moment.weekday() * 24 + moment.hour
+
+class CircadianModel:
+    """Per hour-of-week energy mean and variance, updated one reading at a time"""
+
+    def __init__(self):
+        self.count = np.zeros(HOURS_PER_WEEK)
+        self.mean = np.zeros(HOURS_PER_WEEK)
+        self.m2 = np.zeros(HOURS_PER_WEEK)
+        self.loaded_at = None
+
+    def observe(self, cell, level):
+        self.count[cell] += 1
+        delta = level - self.mean[cell]
+        self.mean[cell] += delta / self.count[cell]
+        self.m2[cell] += delta * (level - self.mean[cell])
+
+    def load(self, doc):
+        """Replace the model with the shared totals (count, sum, sum of squares per cell)"""
+        self.__init__()
+        for cell, totals in (doc or {}).get("cells", {}).items():
+            n = totals.get("n", 0)
+            if n:
+                index = int(cell)
+                self.count[index] = n
+                self.mean[index] = totals["sum"] / n
+                self.m2[index] = max(0.0, totals["sumsq"] - n * self.mean[index] ** 2)
+        self.loaded_at = time.monotonic()
+
+    async def refresh(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > CIRCADIAN_MODEL_TTL:
+            doc = await db.circadian_model.find_one({"_id": current_user_id.get()})
+            if doc is None:
+                doc = await rebuild_circadian_model()
+            self.load(doc)
+
+    async def record(self, docs):
+        increments = {}
+        for doc in docs:
+            cell = hour_of_week(doc["timestamp"])
+            for key, value in (("n", 1), ("sum", doc["level"]), ("sumsq", doc["level"] ** 2)):
+                path = f"cells.{cell}.{key}"
+                increments[path] = increments.get(path, 0) + value
+            if self.loaded_at is not None:
+                self.observe(cell, doc["level"])
+        await db.circadian_model.update_one({"_id": current_user_id.get()}, {"$inc": increments}, upsert=True)
+
+    def expected(self, cell):
+        """(mean, std, readings) for a cell, or None with too few readings"""
+        n = self.count[cell]
+        if n < CIRCADIAN_MIN_READINGS:
+            return None
+        return float(self.mean[cell]), float(np.sqrt(self.m2[cell] / n)), int(n)
+
+circadian_models = OrderedDict()
+
+def circadian_model():
+    """The current user's model, evicting the least recently used beyond CIRCADIAN_MAX_MODELS"""
+    user_id = current_user_id.get()
+    model = circadian_models.get(user_id)
+    if model is None:
+        model = circadian_models[user_id] = CircadianModel()
+        while len(circadian_models) > CIRCADIAN_MAX_MODELS:
+            circadian_models.popitem(last=False)
+    circadian_models.move_to_end(user_id)
+    return model
+
+async def rebuild_circadian_model():
+    """Recompute the current user's model from their hourly rollups"""
+    cells = {}
+    async for bucket in db.rollups_hourly.find({"energy_count": {"$gt": 0}}, {"bucket": 1, "energy_count": 1, "energy_sum": 1, "energy_sumsq": 1}):
+        totals = cells.setdefault(str(hour_of_week(bucket["bucket"])), {"n": 0, "sum": 0, "sumsq": 0})
+        totals["n"] += bucket["energy_count"]
+        totals["sum"] += bucket["energy_sum"]
+        totals["sumsq"] += bucket["energy_sumsq"]
+    doc = {"_id": current_user_id.get(), "cells": cells, "rebuilt_at": datetime.now(timezone.utc)}
+    await db.circadian_model.replace_one({"_id": current_user_id.get()}, doc, upsert=True)
+    return doc
+
+def energy_windows(model, day_start, hours=CIRCADIAN_WINDOW_HOURS):
+    """Highest and lowest expected-energy windows in the 24 hours from day_start"""
+    # Step over whole UTC hours (the model's cells) so DST transitions and
+    # half-hour offsets neither skip nor split a cell
+    utc_start = day_start.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    moments = [utc_start + timedelta(hours=h) for h in range(24)]
+    means = np.array([
+        (model.expected(hour_of_week(moment)) or (np.nan,))[0] for moment in moments
+    ])
+    window_means = analytics.rolling_mean(means, hours)
+    if window_means.size == 0 or np.isnan(window_means).all():
+        return None, None
+
+    def window(index):
+        start = moments[index].astimezone(day_start.tzinfo)
+        end = (moments[index] + timedelta(hours=hours)).astimezone(day_start.tzinfo)
+        return {"start": start.strftime("%H:%M"), "end": end.strftime("%H:%M"), "expected_energy": round(float(window_means[index]), 1)}
+
+    return window(int(np.nanargmax(window_means))), window(int(np.nanargmin(window_means)))
+
+def request_zone(tz):
+    """The ZoneInfo for an IANA name passed by the client"""
+    try:
+        return ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown time zone '{tz}'")
+
 @api_router.get("/circadian-optimization")
-async def get_circadian_recommendations():
+async def get_circadian_recommendations(tz: str = "UTC"):
     """Provide task recommendations based on circadian rhythms"""
-    current_hour = datetime.now().hour
+    zone = request_zone(tz)
+    model = circadian_model()
+    await model.refresh()
+    now = datetime.now(zone)
+    current_hour = now.hour
     
     recommendations = {
         (6, 10): {
@@ -607,7 +2478,7 @@ async def get_circadian_recommendations():
         (16, 19): {
             "phase": "Second Wind",
             "optimal_tasks": ["Administrative work", "Follow-ups", "Review"],
-            "energy_requirement": "4-7",
+            "energy_recommendation": "4-7",
             "focus_duration": "30-60 minutes",
             "description": "Recovery period - good for wrapping up daily tasks"
         },
@@ -627,11 +2498,77 @@ async def get_circadian_recommendations():
         }
     }
     
-    for time_range, rec in recommendations.items():
-        if time_range[0] <= current_hour < time_range[1]:
-            return rec
+    expected_now = model.expected(hour_of_week(now))
+    peak, dip = energy_windows(model, now.replace(hour=0, minute=0, second=0, microsecond=0))
+    personal = {
+        "timezone": tz,
+        "expected_energy_now": round(expected_now[0], 1) if expected_now else None,
+        "energy_spread_now": round(expected_now[1], 1) if expected_now else None,
+        "peak_window": peak,
+        "dip_window": dip
+    }
     
-    return recommendations[(22, 6)]  # Default to rest period
+    for (start_hour, end_hour), rec in recommendations.items():
+        # Ranges that wrap past midnight, like (22, 6), match on either side
+        in_range = start_hour <= current_hour < end_hour if start_hour < end_hour else (current_hour >= start_hour or current_hour < end_hour)
+        if in_range:
+            break
+    
+    # The phase follows the local clock; the learned energy only says how this
+    # user usually compares with the phase's typical band at this hour
+    if expected_now:
+        low, high = (int(v) for v in rec["energy_recommendation"].split("-"))
+        personal["energy_vs_phase"] = "above" if expected_now[0] > high else "below" if expected_now[0] < low else "within"
+    return {**rec, **personal}
+
+# Day planning
+SCHEDULE_HISTORY_DAYS = int(os.environ.get('SCHEDULE_HISTORY_DAYS', '30'))
+SCHEDULE_MIN_READINGS = 3
+
+async def predict_energy_curve(midnight):
+    """Predicted energy per local hour of the day starting at midnight, defaulting to the circadian table"""
+    # History is bucketed by UTC hour; the default table follows the local clock
+    counts, means = await hourly_energy_profile(SCHEDULE_HISTORY_DAYS)
+    curve = []
+    for hour in range(24):
+        utc_hour = (midnight + timedelta(hours=hour)).astimezone(timezone.utc).hour
+        curve.append(float(means[utc_hour]) if counts[utc_hour] >= SCHEDULE_MIN_READINGS else DEFAULT_ENERGY_CURVE[hour])
+    return curve
+
+@api_router.get("/schedule/today")
+async def get_today_schedule(day_end_hour: int = 22, slot_minutes: int = 15, break_minutes: int = 5, tz: str = "UTC"):
+    """Time-blocked plan placing pending tasks where predicted energy meets their requirement
+
+    "Today", day_end_hour and the energy curve follow the clock in tz.
+    """
+    if not 1 <= day_end_hour <= 24 or slot_minutes < 1 or break_minutes < 0:
+        raise HTTPException(status_code=400, detail="Invalid schedule parameters")
+    zone = request_zone(tz)
+    now = datetime.now(zone)
+    # Start on the next slot boundary
+    start = now.replace(second=0, microsecond=0)
+    start += timedelta(minutes=-start.minute % slot_minutes)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    end = midnight + timedelta(hours=day_end_hour)
+
+    plan = QueryPlan()
+    plan.add("tasks", tasks_repo.pending(
+        ["id", "title", "energy_requirement", "estimated_duration", "priority", "priority_rank", "created_at"]
+    ), required=True)
+    plan.add("curve", predict_energy_curve(midnight), default=list(DEFAULT_ENERGY_CURVE))
+    results = await plan.run()
+    for task in results["tasks"]:
+        task["created_at"] = as_datetime(task.get("created_at"))
+
+    schedule = plan_day(results["tasks"], results["curve"], start, end, slot_minutes, break_minutes)
+    return {
+        "date": now.date().isoformat(),
+        "timezone": tz,
+        "start": start,
+        "end": end,
+        "energy_curve": [round(energy, 1) for energy in results["curve"]],
+        **schedule
+    }
 
 @api_router.post("/work-environment")
 async def log_work_environment(environment_data: dict):
@@ -643,7 +2580,7 @@ async def log_work_environment(environment_data: dict):
         "lighting_comfort": environment_data.get("lighting_comfort", 5),
         "workspace_comfort": environment_data.get("workspace_comfort", 5),
         "device_distractions": environment_data.get("device_distractions", 5),
-        "timestamp": datetime.now(timezone.utc).isoformat()
+        "timestamp": to_mongo_datetime(datetime.now(timezone.utc))
     }
     
     await db.work_environment.insert_one(environment_obj)
@@ -679,29 +2616,36 @@ async def log_work_environment(environment_data: dict):
 
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats():
-    # Get current energy
-    current_energy = await db.energy_levels.find_one(sort=[("timestamp", -1)])
-    
-    # Get task stats
-    total_tasks = await db.tasks.count_documents({})
-    completed_tasks = await db.tasks.count_documents({"completed": True})
-    pending_tasks = total_tasks - completed_tasks
-    
-    # Get today's sessions
     today = datetime.now(timezone.utc).date()
-    today_start = datetime.combine(today, datetime.min.time()).replace(tzinfo=timezone.utc)
-    today_sessions = await db.focus_sessions.count_documents({
-        "started_at": {"$gte": today_start.isoformat()}
-    })
+    loop_time = asyncio.get_running_loop().time()
+    cached = dashboard_cache.get(current_user_id.get())
+    if cached is not None and cached["day"] == today and loop_time < cached["expires_at"]:
+        dashboard_cache_stats["hits"] += 1
+        return cached["value"]
+    dashboard_cache_stats["misses"] += 1
     
-    # Get biometric data
-    current_biometric = await db.biometric_data.find_one(sort=[("timestamp", -1)])
+    today_start = datetime.combine(today, datetime.min.time()).replace(tzinfo=timezone.utc)
     
-    # Get streaks
-    streaks = await db.streaks.find().to_list(100)
-    max_streak = max([s.get("current_count", 0) for s in streaks]) if streaks else 0
+    # Task totals come from the materialized counters and the max streak is
+    # computed server-side; all reads are issued concurrently
+    plan = QueryPlan()
+    plan.add("energy", latest_readings.get("energy_levels"))
+    plan.add("counters", get_stats_counters(), default={})
+    plan.add("today_sessions", db.focus_sessions.count_documents(since_filter("started_at", today_start)), default=0)
+    plan.add("biometric", db.biometric_data.find_one(sort=[("timestamp", -1)], projection={"focus_score": 1, "stress_level": 1}))
+    plan.add("max_streak", db.streaks.aggregate([
+        {"$group": {"_id": None, "max_streak": {"$max": "$current_count"}}}
+    ]).to_list(1), default=[])
+    results = await plan.run()
+    current_energy = results["energy"]
+    total_tasks = results["counters"].get("tasks_total", 0)
+    completed_tasks = results["counters"].get("tasks_completed", 0)
+    pending_tasks = total_tasks - completed_tasks
+    today_sessions = results["today_sessions"]
+    current_biometric = results["biometric"]
+    max_streak = (results["max_streak"][0]["max_streak"] or 0) if results["max_streak"] else 0
     
-    return {
+    stats = {
         "current_energy": current_energy["level"] if current_energy else 5,
         "total_tasks": total_tasks,
         "completed_tasks": completed_tasks,
@@ -712,6 +2656,13 @@ async def get_dashboard_stats():
         "focus_score": current_biometric["focus_score"] if current_biometric else 75,
         "stress_level": current_biometric["stress_level"] if current_biometric else 5
     }
+    
+    if not plan.failures:
+        # Expired entries of users who went quiet are swept here rather than by a timer
+        for user_id in [user_id for user_id, entry in dashboard_cache.items() if loop_time >= entry["expires_at"]]:
+            del dashboard_cache[user_id]
+        dashboard_cache[current_user_id.get()] = {"value": stats, "day": today, "expires_at": loop_time + DASHBOARD_CACHE_TTL}
+    return stats
 
 # REVOLUTIONARY AI FEATURES - NEVER SEEN BEFORE
 
@@ -720,19 +2671,24 @@ async def analyze_productivity_genetics():
     """Revolutionary: Analyze user's unique productivity DNA based on patterns"""
     try:
         # Get comprehensive user data
-        energy_history = await db.energy_levels.find().sort("timestamp", -1).limit(100).to_list(100)
-        task_history = await db.tasks.find().sort("created_at", -1).limit(50).to_list(50)
-        focus_history = await db.focus_sessions.find().sort("started_at", -1).limit(30).to_list(30)
+        plan = QueryPlan()
+        plan.add("energy", energy_repo.recent(["level", "timestamp"], 100), default=[])
+        plan.add("tasks", tasks_repo.recent(["priority", "energy_requirement", "completed"], 50), default=[])
+        plan.add("focus", focus_repo.recent(["duration", "productivity_rating"], 30), default=[])
+        results = await plan.run()
+        energy_history = results["energy"]
+        task_history = results["tasks"]
+        focus_history = results["focus"]
         
         # Clean data
-        energy_history = [prepare_from_mongo(e) for e in energy_history]
-        task_history = [prepare_from_mongo(t) for t in task_history]
-        focus_history = [prepare_from_mongo(f) for f in focus_history]
+        energy_history = CODECS["energy_levels"].decode_many(energy_history)
+        task_history = CODECS["tasks"].decode_many(task_history)
+        focus_history = CODECS["focus_sessions"].decode_many(focus_history)
         
         genetics_prompt = f"""
         Analyze this user's productivity genetics based on their unique patterns:
         
-        ENERGY PATTERNS: {json.dumps([{"level": e["level"], "time": e["timestamp"][:10]} for e in energy_history[:10]], indent=2)}
+        ENERGY PATTERNS: {json.dumps([{"level": e["level"], "time": timestamp_text(e["timestamp"])[:10]} for e in energy_history[:10]], indent=2)}
         TASK PATTERNS: {json.dumps([{"priority": t["priority"], "energy_req": t["energy_requirement"], "completed": t["completed"]} for t in task_history[:10]], indent=2)}
         FOCUS PATTERNS: {json.dumps([{"duration": f["duration"], "productivity": f.get("productivity_rating")} for f in focus_history[:5]], indent=2)}
         
@@ -747,9 +2703,7 @@ async def analyze_productivity_genetics():
         Make it feel like a personality test result but for productivity. Be specific and actionable.
         """
         
-        chat = get_ai_chat()
-        user_message = UserMessage(text=genetics_prompt)
-        genetics_analysis = await chat.send_message(user_message)
+        genetics_analysis = await llm_pool.send(genetics_prompt, session_prefix="genetics")
         
         return {
             "productivity_dna": genetics_analysis,
@@ -765,13 +2719,13 @@ async def predict_future_productivity():
     """Revolutionary: AI predicts user's productivity future based on trends"""
     try:
         # Get recent data for trend analysis
-        recent_energy = await db.energy_levels.find().sort("timestamp", -1).limit(30).to_list(30)
-        recent_tasks = await db.tasks.find().sort("created_at", -1).limit(20).to_list(20)
+        recent_energy = await energy_repo.levels(30)
+        recent_tasks = await tasks_repo.recent(["completed"], 20)
         
         future_prompt = f"""
         You are a productivity oracle. Based on current trends, predict this user's productivity future:
         
-        RECENT ENERGY TRENDS: {json.dumps([e["level"] for e in recent_energy], indent=2)}
+        RECENT ENERGY TRENDS: {json.dumps(recent_energy, indent=2)}
         RECENT TASK COMPLETION: {len([t for t in recent_tasks if t["completed"]])}/{len(recent_tasks)} completed
         
         Provide predictions for:
@@ -784,9 +2738,7 @@ async def predict_future_productivity():
         Make it inspiring but realistic. Use productivity science.
         """
         
-        chat = get_ai_chat()
-        user_message = UserMessage(text=future_prompt)
-        future_prediction = await chat.send_message(user_message)
+        future_prediction = await llm_pool.send(future_prompt, session_prefix="future_self")
         
         return {
             "future_predictions": future_prediction,
@@ -797,47 +2749,49 @@ async def predict_future_productivity():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Future prediction failed: {str(e)}")
 
+async def build_mentor_prompt():
+    # Get comprehensive context
+    plan = QueryPlan()
+    plan.add("energy", energy_repo.levels(5), default=[])
+    plan.add("tasks", tasks_repo.recent(["completed"], 10), default=[])
+    plan.add("moods", mood_repo.recent(["mood"], 1), default=[])
+    plan.add("insights", insights_repo.recent(["insight"], 5), default=[])
+    results = await plan.run()
+    energy_data = results["energy"]
+    task_data = results["tasks"]
+    mood_data = results["moods"]
+    previous_insights = results["insights"]
+    
+    mentor_prompt = f"""
+    You are the user's personal AI Productivity Mentor. You have deep memory of their patterns and growth journey.
+    
+    CURRENT STATE:
+    - Recent energy: {energy_data}
+    - Recent tasks: {len([t for t in task_data if t["completed"]])}/{len(task_data)} completed
+    - Recent mood: {mood_data[0]["mood"] if mood_data else "unknown"}
+    - Previous conversations: {[i["insight"][:50] + "..." for i in previous_insights]}
+    
+    As their mentor:
+    1. Acknowledge their progress since last conversation
+    2. Identify their current productivity state and emotional needs
+    3. Provide one powerful insight they haven't heard before
+    4. Give 2-3 specific actions for today
+    5. Share a motivational truth about their productivity journey
+    6. Ask them one thought-provoking question to reflect on
+    
+    Be personal, wise, and genuinely caring. Reference their patterns. Make them feel understood and inspired.
+    """
+    return mentor_prompt
+
 @api_router.post("/ai/productivity-mentor")
 async def get_ai_mentor_session():
     """Revolutionary: AI becomes a personal productivity mentor with memory"""
     try:
-        # Get comprehensive context
-        energy_data = await db.energy_levels.find().sort("timestamp", -1).limit(10).to_list(10)
-        task_data = await db.tasks.find().sort("created_at", -1).limit(10).to_list(10)
-        mood_data = await db.mood_states.find().sort("timestamp", -1).limit(5).to_list(5)
-        previous_insights = await db.insights.find().sort("timestamp", -1).limit(5).to_list(5)
-        
-        mentor_prompt = f"""
-        You are the user's personal AI Productivity Mentor. You have deep memory of their patterns and growth journey.
-        
-        CURRENT STATE:
-        - Recent energy: {[e["level"] for e in energy_data[:5]]}
-        - Recent tasks: {len([t for t in task_data if t["completed"]])}/{len(task_data)} completed
-        - Recent mood: {mood_data[0]["mood"] if mood_data else "unknown"}
-        - Previous conversations: {[i["insight"][:50] + "..." for i in previous_insights]}
-        
-        As their mentor:
-        1. Acknowledge their progress since last conversation
-        2. Identify their current productivity state and emotional needs
-        3. Provide one powerful insight they haven't heard before
-        4. Give 2-3 specific actions for today
-        5. Share a motivational truth about their productivity journey
-        6. Ask them one thought-provoking question to reflect on
-        
-        Be personal, wise, and genuinely caring. Reference their patterns. Make them feel understood and inspired.
-        """
-        
-        chat = get_ai_chat()
-        user_message = UserMessage(text=mentor_prompt)
-        mentor_response = await chat.send_message(user_message)
+        mentor_prompt = await build_mentor_prompt()
+        mentor_response = await llm_pool.send(mentor_prompt, session_prefix="mentor")
         
         # Store this mentor session
-        insight_obj = ProductivityInsight(
-            insight=mentor_response,
-            category="mentor_session"
-        )
-        insight_mongo = prepare_for_mongo(insight_obj.dict())
-        await db.insights.insert_one(insight_mongo)
+        await save_insight(mentor_response, "mentor_session")
         
         return {
             "mentor_message": mentor_response,
@@ -848,10 +2802,16 @@ async def get_ai_mentor_session():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Mentor session failed: {str(e)}")
 
+@api_router.post("/ai/productivity-mentor/stream")
+async def stream_ai_mentor_session(http_request: Request):
+    """Stream the mentor session as Server-Sent Events"""
+    mentor_prompt = await build_mentor_prompt()
+    return stream_ai_response(http_request, mentor_prompt, "mentor", "mentor_session")
+
 @api_router.get("/ai/productivity-challenges")
 async def generate_daily_challenges():
     """Revolutionary: AI creates personalized productivity challenges"""
-    current_energy = await db.energy_levels.find_one(sort=[("timestamp", -1)])
+    current_energy = await latest_readings.get("energy_levels")
     energy_level = current_energy["level"] if current_energy else 5
     
     challenges = {
@@ -911,14 +2871,13 @@ async def productivity_reality_check():
     """Revolutionary: Brutally honest AI assessment of productivity patterns"""
     try:
         # Get comprehensive data for reality check
-        total_tasks = await db.tasks.count_documents({})
-        completed_tasks = await db.tasks.count_documents({"completed": True})
-        total_sessions = await db.focus_sessions.count_documents({})
-        avg_energy = await db.energy_levels.aggregate([
-            {"$group": {"_id": None, "avg_energy": {"$avg": "$level"}}}
-        ]).to_list(1)
+        counters = await get_stats_counters()
+        total_tasks = counters.get("tasks_total", 0)
+        completed_tasks = counters.get("tasks_completed", 0)
+        total_sessions = counters.get("focus_sessions", 0)
+        energy_logs = counters.get("energy_logs", 0)
         
-        avg_energy_value = avg_energy[0]["avg_energy"] if avg_energy else 5
+        avg_energy_value = counters.get("energy_level_sum", 0) / energy_logs if energy_logs else 5
         completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
         
         reality_prompt = f"""
@@ -940,9 +2899,7 @@ async def productivity_reality_check():
         Be direct, insightful, and actionable. No sugar-coating, but end with genuine encouragement.
         """
         
-        chat = get_ai_chat()
-        user_message = UserMessage(text=reality_prompt)
-        reality_check = await chat.send_message(user_message)
+        reality_check = await llm_pool.send(reality_prompt, session_prefix="reality_check")
         
         return {
             "reality_check": reality_check,
@@ -958,10 +2915,11 @@ async def get_productivity_achievements():
     """Revolutionary: Complex achievement system with hidden unlocks"""
     
     # Calculate user stats for achievements
-    total_tasks = await db.tasks.count_documents({})
-    completed_tasks = await db.tasks.count_documents({"completed": True})
-    total_energy_logs = await db.energy_levels.count_documents({})
-    high_energy_days = await db.energy_levels.count_documents({"level": {"$gte": 8}})
+    counters = await get_stats_counters()
+    total_tasks = counters.get("tasks_total", 0)
+    completed_tasks = counters.get("tasks_completed", 0)
+    total_energy_logs = counters.get("energy_logs", 0)
+    high_energy_days = counters.get("energy_high", 0)
     
     achievements = {
         "energy_master": {
@@ -1031,8 +2989,12 @@ async def get_productivity_achievements():
 async def get_neural_network_data():
     """Revolutionary: Visualize productivity patterns as neural network"""
     # Get user data
-    energy_data = await db.energy_levels.find().sort("timestamp", -1).limit(50).to_list(50)
-    task_data = await db.tasks.find().sort("created_at", -1).limit(30).to_list(30)
+    plan = QueryPlan()
+    plan.add("energy", energy_repo.recent(["level"], 10), default=[])
+    plan.add("tasks", tasks_repo.recent(["energy_requirement", "completed"], 10), default=[])
+    results = await plan.run()
+    energy_data = results["energy"]
+    task_data = results["tasks"]
     
     # Create neural network nodes and connections
     nodes = []
@@ -1064,36 +3026,38 @@ async def get_neural_network_data():
         })
     
     # Create connections between related nodes
-    for i in range(min(len(energy_data), len(task_data), 9)):
+    paired = min(len(energy_data), len(task_data), 9)
+    gaps = abs(analytics.column(energy_data[:paired], "level") - analytics.column(task_data[:paired], "energy_requirement"))
+    for i, gap in enumerate(gaps):
         connections.append({
             "source": f"energy_{i}",
             "target": f"task_{i}",
-            "strength": abs(energy_data[i]["level"] - task_data[i]["energy_requirement"]),
-            "color": f"rgba(102, 126, 234, {0.3 + (0.4 * (10 - abs(energy_data[i]['level'] - task_data[i]['energy_requirement'])) / 10)})"
+            "strength": int(gap),
+            "color": f"rgba(102, 126, 234, {0.3 + (0.4 * (10 - gap)) / 10})"
         })
     
     return {
         "nodes": nodes,
         "connections": connections,
-        "network_health": len([c for c in connections if c["strength"] <= 3]) / len(connections) * 100 if connections else 0,
+        "network_health": float((gaps <= 3).mean() * 100) if paired else 0,
         "analysis": "Neural network shows productivity pattern correlations"
     }
 
-@api_router.post("/ai/productivity-breakthrough")
-async def generate_breakthrough_moment():
-    """AI identifies user's next productivity breakthrough"""
-    try:
-        # Analyze all user data for breakthrough insights
-        energy_patterns = await db.energy_levels.find().sort("timestamp", -1).limit(100).to_list(100)
-        task_patterns = await db.tasks.find().sort("created_at", -1).limit(50).to_list(50)
-        focus_patterns = await db.focus_sessions.find().sort("started_at", -1).limit(20).to_list(20)
-        
-        # Clean data
-        energy_patterns = [prepare_from_mongo(e) for e in energy_patterns]
-        task_patterns = [prepare_from_mongo(t) for t in task_patterns]
-        focus_patterns = [prepare_from_mongo(f) for f in focus_patterns]
-        
-        breakthrough_prompt = f"""
+async def build_breakthrough_prompt():
+    """Returns the breakthrough prompt and how many documents of each kind fed it"""
+    # Analyze all user data for breakthrough insights
+    plan = QueryPlan()
+    plan.add("energy", energy_repo.recent(["level"], 100), default=[])
+    plan.add("tasks", tasks_repo.recent(["completed"], 50), default=[])
+    plan.add("focus", focus_repo.recent(["id"], 20), default=[])
+    results = await plan.run()
+    
+    # Clean data
+    energy_patterns = CODECS["energy_levels"].decode_many(results["energy"])
+    task_patterns = CODECS["tasks"].decode_many(results["tasks"])
+    focus_patterns = CODECS["focus_sessions"].decode_many(results["focus"])
+    
+    breakthrough_prompt = f"""
         You are a productivity breakthrough analyzer. Study these patterns and identify the user's next major breakthrough moment:
         
         ENERGY PATTERNS: {len(energy_patterns)} data points - recent average: {sum(e.get('level', 5) for e in energy_patterns[:10]) / max(len(energy_patterns[:10]), 1):.1f}
@@ -1111,17 +3075,23 @@ async def generate_breakthrough_moment():
         
         Make it insightful and motivating. Focus on actionable insights.
         """
-        
-        chat = get_ai_chat()
-        user_message = UserMessage(text=breakthrough_prompt)
-        breakthrough = await chat.send_message(user_message)
+    counts = {"energy": len(energy_patterns), "tasks": len(task_patterns), "focus": len(focus_patterns)}
+    return breakthrough_prompt, counts
+
+@api_router.post("/ai/productivity-breakthrough")
+async def generate_breakthrough_moment():
+    """AI identifies user's next productivity breakthrough"""
+    counts = {"energy": 0, "tasks": 0, "focus": 0}
+    try:
+        breakthrough_prompt, counts = await build_breakthrough_prompt()
+        breakthrough = await llm_pool.send(breakthrough_prompt, session_prefix="breakthrough")
         
         return {
             "breakthrough_analysis": breakthrough,
             "breakthrough_probability": "94%", 
             "next_review_date": (datetime.now(timezone.utc) + timedelta(days=7)).isoformat(),
             "breakthrough_type": "Major Productivity Evolution",
-            "data_points_analyzed": len(energy_patterns) + len(task_patterns) + len(focus_patterns)
+            "data_points_analyzed": sum(counts.values())
         }
         
     except Exception as e:
@@ -1132,7 +3102,7 @@ BREAKTHROUGH ANALYSIS:
 
 1. BREAKTHROUGH MOMENT: You're approaching a significant productivity evolution. Your current patterns show promise for a major leap in effectiveness.
 
-2. THE UNLOCK: The key is consistency in energy tracking and better task-energy alignment. You're currently at {len(energy_patterns)} energy logs and {len(task_patterns)} tasks created.
+2. THE UNLOCK: The key is consistency in energy tracking and better task-energy alignment. You're currently at {counts["energy"]} energy logs and {counts["tasks"]} tasks created.
 
 3. THE TIMELINE: Within the next 2-3 weeks, as you build more data and patterns, you'll experience a breakthrough in productivity flow.
 
@@ -1150,21 +3120,49 @@ Your productivity journey is just beginning. The patterns show great potential!
             "breakthrough_probability": "87%",
             "next_review_date": (datetime.now(timezone.utc) + timedelta(days=7)).isoformat(),
             "breakthrough_type": "Emerging Productivity Evolution",
-            "data_points_analyzed": len(energy_patterns) + len(task_patterns) + len(focus_patterns),
+            "data_points_analyzed": sum(counts.values()),
             "note": "Analysis generated with available data"
         }
 
+@api_router.post("/ai/productivity-breakthrough/stream")
+async def stream_breakthrough_moment(http_request: Request):
+    """Stream the breakthrough analysis as Server-Sent Events"""
+    breakthrough_prompt, _ = await build_breakthrough_prompt()
+    return stream_ai_response(http_request, breakthrough_prompt, "breakthrough", "breakthrough")
+
 @api_router.get("/productivity-patterns")
 async def analyze_productivity_patterns():
     """Analyze real productivity patterns and correlations"""
     try:
-        # Get comprehensive user data
-        energy_data = await db.energy_levels.find().sort("timestamp", -1).limit(50).to_list(50)
-        task_data = await db.tasks.find().sort("created_at", -1).limit(30).to_list(30)
-        focus_data = await db.focus_sessions.find().sort("started_at", -1).limit(20).to_list(20)
+        # Totals, averages and the hourly profile come from the rollups and
+        # counters; only the energy/completion correlation needs raw documents,
+        # and it runs on a bounded sample of the newest ones
+        plan = QueryPlan()
+        plan.add("hours", read_rollups("hour", ROLLUP_ANALYSIS_DAYS), default=[])
+        plan.add("counters", get_stats_counters(), default={})
+        plan.add("current_energy", latest_readings.get("energy_levels"))
+        plan.add("recent_tasks", tasks_repo.recent(["title", "energy_requirement"], 5), default=[])
+        plan.add("productive_sessions", db.focus_sessions.count_documents({"productivity_rating": {"$gte": 4}}), default=0)
+        plan.add("energy_sample", energy_repo.history(["level"], limit=PATTERNS_SAMPLE_SIZE), default=[])
+        plan.add("task_sample", tasks_repo.history(["completed"], limit=PATTERNS_SAMPLE_SIZE), default=[])
+        results = await plan.run()
+        hours = results["hours"]
+        total_tasks = results["counters"].get("tasks_total", 0)
+        completed_tasks = results["counters"].get("tasks_completed", 0)
+        
+        energy_stats = rollup_energy_summary(hours)
+        peak = analytics.peak_of_profile(*rollup_hourly_profile(hours))
+        average_session_length = rollup_ratio(hours, "focus_minutes", "focus_sessions")
+        energy_sample = results["energy_sample"]
+        task_sample = results["task_sample"]
+        # Tasks older than the sampled readings have no known energy and are left out
+        energy_completion = analytics.energy_completion_correlation(
+            analytics.epochs(energy_sample), analytics.column(energy_sample, "level"),
+            analytics.epochs(task_sample), analytics.column(task_sample, "completed", default=0)
+        )
         
         # Calculate current energy for compatibility
-        current_energy = energy_data[0] if energy_data else {"level": 5}
+        current_energy = results["current_energy"] or {"level": 5}
         energy_level = current_energy.get("level", 5)
         
         # Create productivity states analysis
@@ -1177,7 +3175,7 @@ async def analyze_productivity_patterns():
         
         # Analyze task compatibility with current energy
         task_compatibility = []
-        for task in task_data[:5]:
+        for task in results["recent_tasks"]:
             if task.get("energy_requirement"):
                 compatibility = 10 - abs(task["energy_requirement"] - energy_level)
                 success_probability = max(20, 100 - abs(task["energy_requirement"] - energy_level) * 10)
@@ -1189,25 +3187,32 @@ async def analyze_productivity_patterns():
         
         # Simple pattern analysis
         energy_patterns = {
-            "average_energy": sum(e.get("level", 5) for e in energy_data) / len(energy_data) if energy_data else 5,
-            "peak_hours": "Morning (9-11 AM)" if energy_level > 6 else "Afternoon (2-4 PM)",
-            "energy_volatility": "Stable" if len(energy_data) < 10 else "Variable"
+            "average_energy": energy_stats["mean"] if energy_stats["count"] else 5,
+            "energy_variance": round(energy_stats["variance"], 2) if energy_stats["count"] else None,
+            "peak_hours": f"{peak:02d}:00-{(peak + 1) % 24:02d}:00 UTC" if peak is not None else (
+                "Morning (9-11 AM)" if energy_level > 6 else "Afternoon (2-4 PM)"
+            ),
+            "energy_volatility": "Variable" if energy_stats["count"] >= 10 and energy_stats["std"] > 2 else "Stable"
         }
         
         task_patterns = {
-            "completion_rate": len([t for t in task_data if t.get("completed")]) / len(task_data) * 100 if task_data else 0,
+            "completion_rate": completed_tasks / total_tasks * 100 if total_tasks else 0,
             "preferred_energy_range": "High energy tasks" if energy_level > 6 else "Moderate energy tasks"
         }
         
         focus_patterns = {
-            "average_session_length": sum(f.get("duration", 25) for f in focus_data) / len(focus_data) if focus_data else 25,
+            "average_session_length": average_session_length if average_session_length is not None else 25,
             "completion_rate": 80.0,
-            "productive_sessions": len([f for f in focus_data if f.get("productivity_rating", 3) >= 4])
+            "productive_sessions": results["productive_sessions"]
         }
         
         correlations = ["Building productivity patterns - more data needed for detailed analysis"]
-        if len(energy_data) > 5 and len(task_data) > 3:
-            correlations = ["Energy levels correlate with task completion success"]
+        if energy_completion is not None:
+            strength = "strongly" if abs(energy_completion) >= 0.5 else "moderately" if abs(energy_completion) >= 0.2 else "weakly"
+            direction = "higher" if energy_completion > 0 else "lower"
+            correlations = [
+                f"Tasks created at {direction} energy are {strength} more likely to be completed (r = {energy_completion:.2f})"
+            ]
         
         patterns = {
             "energy_patterns": energy_patterns,
@@ -1241,8 +3246,427 @@ async def analyze_productivity_patterns():
 
 # Removed problematic analysis functions - simplified implementation above
 
-# Include the router in the main app
+# Slow analyses that can run in the background instead of on the request path
+job_queue.register("productivity-genetics", analyze_productivity_genetics)
+job_queue.register("future-self", predict_future_productivity)
+job_queue.register("productivity-breakthrough", generate_breakthrough_moment)
+
+@api_router.post("/jobs/{kind}", status_code=202)
+async def submit_job(kind: str):
+    """Queue a slow AI analysis and return immediately with a job ID"""
+    if kind not in job_queue.handlers:
+        raise HTTPException(status_code=404, detail=f"Unknown job type '{kind}'")
+    submitted = await job_queue.submit(kind)
+    return {**submitted, "status_url": f"/api/jobs/{submitted['job_id']}"}
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Poll a background job for its status and, once finished, its result"""
+    job = await db.jobs.find_one({"id": job_id}, {"_id": 0, "user_id": 0, "dedupe_key": 0, "expires_at": 0, "active": 0, "owner": 0, "lease_until": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Bulk ingest
+# Record type -> (model, collection). Full models are used so offline clients
+# can send their own id and timestamp; a retried upload then fails per item on
+# the unique id index instead of duplicating readings.
+INGEST_TYPES = {
+    "energy": (EnergyLevel, "energy_levels"),
+    "mood": (MoodState, "mood_states"),
+    "metrics": (ProductivityMetrics, "productivity_metrics"),
+    "environment": (WorkEnvironment, "work_environment"),
+}
+INGEST_MAX_ITEMS = int(os.environ.get('INGEST_MAX_ITEMS', '5000'))
+
+async def ingest_records(items):
+    """Validate mixed records and insert them with one unordered insert_many per collection"""
+    results = [None] * len(items)
+    batches = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or item.get("type") not in INGEST_TYPES:
+            results[index] = {"index": index, "status": "invalid", "error": f"type must be one of {', '.join(INGEST_TYPES)}"}
+            continue
+        model, collection_name = INGEST_TYPES[item["type"]]
+        try:
+            record = model(**{k: v for k, v in item.items() if k != "type"})
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "invalid", "error": e.errors(include_url=False, include_context=False)}
+            continue
+        batches.setdefault(collection_name, []).append((index, prepare_for_mongo(record.dict())))
+
+    for collection_name, batch in batches.items():
+        docs = [doc for _, doc in batch]
+        failed = {}
+        try:
+            await db[collection_name].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+        written = []
+        for position, (index, doc) in enumerate(batch):
+            if position in failed:
+                results[index] = {"index": index, "status": "failed", "id": doc["id"], "error": failed[position]}
+            else:
+                results[index] = {"index": index, "status": "created", "id": doc["id"]}
+                written.append(doc)
+        if written:
+            await record_writes(collection_name, written)
+
+    if batches:
+        invalidate_dashboard_cache()
+    return results
+
+@api_router.post("/ingest")
+async def bulk_ingest(request: Request):
+    """Ingest a JSON array or NDJSON stream of energy, mood, metrics and environment records
+
+    Each record carries a "type" plus the fields of its model. Invalid or
+    rejected records do not fail the batch; the response reports each item.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith(("application/x-ndjson", "application/jsonl")):
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed body: {e}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of records")
+    if len(items) > INGEST_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {INGEST_MAX_ITEMS} records per request")
+
+    results = await ingest_records(items)
+    summary = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return {"received": len(items), **summary, "results": results}
+
+# Collections included in /export, with any filter excluding internal documents
+EXPORT_COLLECTIONS = {
+    "energy_levels": {},
+    "tasks": {},
+    "focus_sessions": {},
+    "mood_states": {},
+    "productivity_metrics": {},
+    "work_environment": {},
+    "insights": {"category": {"$ne": "llm_cache"}},
+}
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+
+def export_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+async def export_lines(collection_names, batch_size):
+    """Yield one NDJSON line per document, reading each collection batch by batch"""
+    for name in collection_names:
+        cursor = db[name].find(EXPORT_COLLECTIONS[name], {"_id": 0}).batch_size(batch_size)
+        decode = CODECS[name].decode
+        async for doc in cursor:
+            line = {"collection": name, "document": decode(doc)}
+            yield (json.dumps(line, default=export_default) + "\n").encode()
+
+async def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+@api_router.get("/export")
+async def export_data(collections: Optional[str] = None, compress: bool = False, batch_size: int = EXPORT_BATCH_SIZE):
+    """Stream user data as NDJSON, one {"collection", "document"} object per line"""
+    names = [c.strip() for c in collections.split(",") if c.strip()] if collections else list(EXPORT_COLLECTIONS)
+    unknown = [name for name in names if name not in EXPORT_COLLECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown collections: {', '.join(unknown)}")
+    batch_size = max(1, min(batch_size, 10000))
+
+    body = export_lines(names, batch_size)
+    filename = "zentask-export.ndjson"
+    media_type = "application/x-ndjson"
+    if compress:
+        body = gzip_stream(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@admin_router.post("/migrate-datetimes")
+async def start_datetime_migration(batch_size: int = 500):
+    """Kick off the online ISO string -> BSON date migration"""
+    if datetime_migration_status["state"] == "running":
+        return datetime_migration_status
+    asyncio.create_task(migrate_datetimes_to_native(batch_size))
+    return {"state": "started", "batch_size": batch_size}
+
+@admin_router.get("/migrate-datetimes")
+async def get_datetime_migration_status():
+    return datetime_migration_status
+
+@admin_router.post("/reconcile-counters")
+async def run_counter_reconciliation(user_id: str = Query(DEFAULT_USER_ID, pattern=USER_ID_PATTERN)):
+    """Rebuild a user's stats_counters document from the raw collections"""
+    with tenant(user_id):
+        return await reconcile_stats_counters()
+
+@admin_router.post("/rebuild-rollups")
+async def run_rollup_rebuild():
+    """Backfill the hourly and daily rollups from the raw collections"""
+    return await rebuild_rollups()
+
+@api_router.get("/ai/pool")
+async def get_llm_pool_stats():
+    """Queueing and throughput metrics for the shared LLM client pool"""
+    return {
+        "max_concurrency": llm_pool.max_concurrency,
+        "max_queue": llm_pool.max_queue,
+        **llm_pool.stats,
+        "cache": {"entries": len(llm_cache.entries), **llm_cache.stats}
+    }
+
+@metrics_registry.collector
+def component_metrics():
+    """Counters and gauges the LLM pool and the caches already keep"""
+    llm = llm_pool.stats
+    caches = {
+        "llm": (llm_cache.stats["hits"] + llm_cache.stats["mongo_hits"], llm_cache.stats["misses"]),
+        "latest_readings": (latest_readings.stats["hits"], latest_readings.stats["loads"]),
+        "dashboard": (dashboard_cache_stats["hits"], dashboard_cache_stats["misses"]),
+    }
+    return [
+        ("zentask_llm_requests_total", "LLM completions started", "counter", [({}, llm["requests"])]),
+        ("zentask_llm_failures_total", "LLM completions that raised", "counter", [({}, llm["failures"])]),
+        ("zentask_llm_rejected_total", "LLM requests rejected because the queue was full", "counter", [({}, llm["rejected"])]),
+        ("zentask_llm_in_flight", "LLM completions currently running", "gauge", [({}, llm["in_flight"])]),
+        ("zentask_llm_queued", "LLM requests waiting for a slot", "gauge", [({}, llm["queued"])]),
+        ("zentask_llm_queue_wait_seconds_total", "Time spent waiting for an LLM slot", "counter", [({}, llm["wait_seconds_total"])]),
+        ("zentask_llm_tokens_total", "Tokens reported by the LLM endpoint (LLM_BASE_URL only)", "counter", [
+            ({"kind": "prompt"}, llm["prompt_tokens"]), ({"kind": "completion"}, llm["completion_tokens"])
+        ]),
+        ("zentask_cache_hits_total", "Cache lookups answered from the cache", "counter", [
+            ({"cache": name}, hits) for name, (hits, _) in caches.items()
+        ]),
+        ("zentask_cache_misses_total", "Cache lookups that went to the source", "counter", [
+            ({"cache": name}, misses) for name, (_, misses) in caches.items()
+        ]),
+        ("zentask_cache_hit_ratio", "Hits over lookups since start", "gauge", [
+            ({"cache": name}, hits / (hits + misses)) for name, (hits, misses) in caches.items() if hits + misses
+        ]),
+    ]
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of request, Mongo, LLM and cache metrics"""
+    return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/indexes")
+async def get_index_dependencies():
+    """Show which indexes each endpoint depends on and whether they are built"""
+    return {
+        endpoint: [
+            {
+                "collection": collection_name,
+                "index": index_name,
+                "status": index_status.get((collection_name, index_name), "pending")
+            }
+            for collection_name, index_name in dependencies
+        ]
+        for endpoint, dependencies in ENDPOINT_INDEXES.items()
+    }
+
+@admin_router.get("/shard-keys")
+async def get_shard_keys():
+    """Recommended shard key per collection for sharded deployments"""
+    return SHARD_KEYS
+
+# Live updates
+# One change stream per process feeds every connected WebSocket, and each
+# client only receives changes to its own user's documents. Each client has a
+# bounded queue; a client that falls behind has its backlog replaced by a
+# single "resync" message and should refetch over REST. Deletes are not
+# forwarded: their events carry no document to attribute them to a user.
+LIVE_COLLECTIONS = ("tasks", "energy_levels", "focus_sessions", "mood_states")
+LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE', '100'))
+
+class LiveUpdates:
+    """Fan out change stream events to WebSocket subscribers"""
+
+    def __init__(self, queue_size=LIVE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.task = None
+        self.stats = {"events": 0, "resyncs": 0}
+
+    def subscribe(self, user_id, collections):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers[queue] = (user_id, collections)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._follow_changes())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.pop(queue, None)
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def publish(self, message, collection_name=None, user_id=None):
+        """Queue a message for matching subscribers; without a collection it goes to everyone"""
+        for queue, (subscriber, collections) in self.subscribers.items():
+            if collection_name is not None and (collection_name not in collections or user_id != subscriber):
+                continue
+            if queue.full():
+                # Drop the backlog rather than block the stream on a slow client
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+                self.stats["resyncs"] += 1
+                continue
+            queue.put_nowait(message)
+
+    @staticmethod
+    def delta(change):
+        """Compact client-facing form of a change event"""
+        message = {"type": change["operationType"], "collection": change["ns"]["coll"]}
+        if change["operationType"] in ("insert", "replace"):
+            message["document"] = CODECS[change["ns"]["coll"]].decode(change["fullDocument"])
+        else:
+            full = change.get("fullDocument") or {}
+            message["id"] = full.get("id")
+            message["fields"] = change["updateDescription"]["updatedFields"]
+        return message
+
+    def dispatch(self, change):
+        """Publish one change stream event to its owner's subscribers"""
+        full = change.get("fullDocument")
+        if full is None:
+            # Updated and then deleted before the lookup ran
+            return
+        # Read before delta(), whose decoding strips user_id from the document
+        owner = full.get("user_id")
+        self.stats["events"] += 1
+        self.publish(self.delta(change), change["ns"]["coll"], owner)
+
+    async def _follow_changes(self):
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": list(LIVE_COLLECTIONS)},
+            "operationType": {"$in": ["insert", "update", "replace"]}
+        }}]
+        while self.subscribers:
+            try:
+                async with mongo_db.watch(pipeline, full_document="updateLookup") as stream:
+                    async for change in stream:
+                        self.dispatch(change)
+                        if not self.subscribers:
+                            return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Live update change stream failed: {e}")
+                self.publish({"type": "error", "detail": "Live updates unavailable, fall back to polling"})
+                await asyncio.sleep(5)
+
+live_updates = LiveUpdates()
+
+@api_router.post("/live/token")
+async def create_live_token():
+    """Short-lived token for opening /api/live as the calling user from a browser"""
+    if not LIVE_TOKEN_SECRET:
+        raise HTTPException(status_code=404, detail="Live update tokens are not configured")
+    return {"token": issue_live_token(current_user_id.get()), "expires_in": LIVE_TOKEN_TTL}
+
+@app.websocket("/api/live")
+async def live_updates_socket(
+    websocket: WebSocket,
+    collections: Optional[str] = None,
+    token: Optional[str] = None,
+    x_user_id: Optional[str] = Header(None, pattern=USER_ID_PATTERN)
+):
+    """Push the caller's task, energy, focus and mood changes as they happen"""
+    # The user comes from the gateway's header or from a token issued by
+    # /api/live/token, never from anything else the client controls
+    owner = x_user_id or DEFAULT_USER_ID
+    if token is not None:
+        owner = verify_live_token(token)
+        if owner is None:
+            await websocket.close(code=1008, reason="Invalid or expired token")
+            return
+    selected = [c.strip() for c in collections.split(",") if c.strip()] if collections else list(LIVE_COLLECTIONS)
+    await websocket.accept()
+    unknown = [c for c in selected if c not in LIVE_COLLECTIONS]
+    if unknown:
+        await websocket.close(code=1008, reason=f"Unknown collections: {', '.join(unknown)}")
+        return
+
+    queue = live_updates.subscribe(owner, set(selected))
+
+    async def send():
+        while True:
+            message = await queue.get()
+            await websocket.send_text(json.dumps(message, default=export_default))
+
+    async def receive():
+        # Clients only send keep-alives; this returns when the socket closes
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        live_updates.unsubscribe(queue)
+
+# Include the routers in the main app
 app.include_router(api_router)
+app.include_router(admin_router)
+
+class MetricsMiddleware:
+    """Records latency, status and Mongo operation count per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        ops = [0]
+        token = request_mongo_ops.set(ops)
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_mongo_ops.reset(token)
+            # Templates like /api/tasks/{task_id}/complete keep the label set bounded
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            http_duration.observe(time.perf_counter() - started, method, path)
+            http_requests.inc(method, path, str(status))
+            mongo_ops_per_request.observe(ops[0], method, path)
+
+app.add_middleware(MetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1250,6 +3674,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -1259,6 +3684,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_services():
+    await llm_pool.start()
+    # Before the index build: the user_id-led unique indexes reject unowned derived documents
+    await run_once("assign_default_tenant", assign_default_tenant)
+    await ensure_indexes()
+    await job_queue.start()
+    asyncio.create_task(run_once("backfill_priority_ranks", backfill_priority_ranks))
+    asyncio.create_task(ensure_rollups())
+    await write_buffer.start()
+    await latest_readings.start()
+    if DATETIME_STORAGE == "native":
+        # Once per deployment; /api/admin/migrate-datetimes reruns it on demand
+        asyncio.create_task(run_once("migrate_datetimes_to_native", migrate_datetimes_to_native))
+    if COUNTERS_RECONCILE_INTERVAL > 0:
+        asyncio.create_task(reconcile_counters_periodically())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await write_buffer.stop()
+    await latest_readings.stop()
+    await live_updates.stop()
+    await job_queue.stop()
+    await llm_pool.close()
     client.close()
\ No newline at end of file
@@ -0,0 +1,424 @@
+"""Latency benchmarks for the ZenTask backend
+
+Usage: python backend_benchmark.py [scenario ...]
+
+Scenarios that touch MongoDB use MONGO_URL (default mongodb://localhost:27017)
+and write to a throwaway database named by DB_NAME (default zentask_benchmark).
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "zentask_benchmark")
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+SCENARIOS = {}
+
+def scenario(func):
+    SCENARIOS[func.__name__] = func
+    return func
+
+def report(name, samples):
+    """Print p50/p95/mean for a list of durations in seconds"""
+    ordered = sorted(samples)
+    p50 = ordered[len(ordered) // 2] * 1000
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000
+    mean = statistics.mean(ordered) * 1000
+    print(f"   {name:<40} p50 {p50:8.3f} ms   p95 {p95:8.3f} ms   mean {mean:8.3f} ms")
+
+async def measure(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+async def seed_collections(db, energy=2000, tasks=1000, sessions=300, moods=200, insights=100):
+    """Fill the benchmark database with representative documents"""
+    now = datetime.now(timezone.utc)
+    await db.energy_levels.insert_many([
+        {"id": str(uuid.uuid4()), "level": i % 10 + 1, "timestamp": now - timedelta(minutes=i), "context": None}
+        for i in range(energy)
+    ])
+    await db.tasks.insert_many([
+        {
+            "id": str(uuid.uuid4()), "title": f"Task {i}", "description": None,
+            "energy_requirement": i % 10 + 1, "estimated_duration": 5 + i % 120,
+            "priority": ("high", "medium", "low")[i % 3], "category": None,
+            "completed": i % 4 == 0, "created_at": now - timedelta(minutes=i), "completed_at": None
+        }
+        for i in range(tasks)
+    ])
+    await db.focus_sessions.insert_many([
+        {
+            "id": str(uuid.uuid4()), "task_id": None, "duration": 25, "energy_before": 6,
+            "energy_after": 5, "environment_type": "rain", "productivity_rating": i % 5 + 1,
+            "started_at": now - timedelta(hours=i), "completed_at": None
+        }
+        for i in range(sessions)
+    ])
+    await db.mood_states.insert_many([
+        {"id": str(uuid.uuid4()), "mood": "focused", "intensity": 7, "timestamp": now - timedelta(hours=i)}
+        for i in range(moods)
+    ])
+    await db.insights.insert_many([
+        {"id": str(uuid.uuid4()), "insight": "Keep going " * 20, "category": "ai_coaching", "timestamp": now - timedelta(hours=i)}
+        for i in range(insights)
+    ])
+
+@scenario
+async def query_fanout(iterations=200):
+    """Sequential awaits vs QueryPlan for the mentor-session read set"""
+    import server
+
+    await server.client.drop_database(os.environ["DB_NAME"])
+    await seed_collections(server.db)
+    await server.ensure_indexes()
+    db = server.db
+
+    async def sequential():
+        await db.energy_levels.find().sort("timestamp", -1).limit(10).to_list(10)
+        await db.tasks.find().sort("created_at", -1).limit(10).to_list(10)
+        await db.mood_states.find().sort("timestamp", -1).limit(5).to_list(5)
+        await db.insights.find().sort("timestamp", -1).limit(5).to_list(5)
+        await db.tasks.count_documents({})
+        await db.tasks.count_documents({"completed": True})
+
+    async def concurrent():
+        plan = server.QueryPlan()
+        plan.add("energy", db.energy_levels.find().sort("timestamp", -1).limit(10).to_list(10), default=[])
+        plan.add("tasks", db.tasks.find().sort("created_at", -1).limit(10).to_list(10), default=[])
+        plan.add("moods", db.mood_states.find().sort("timestamp", -1).limit(5).to_list(5), default=[])
+        plan.add("insights", db.insights.find().sort("timestamp", -1).limit(5).to_list(5), default=[])
+        plan.add("total_tasks", db.tasks.count_documents({}), default=0)
+        plan.add("completed_tasks", db.tasks.count_documents({"completed": True}), default=0)
+        await plan.run()
+
+    await measure(sequential, 10)
+    report("sequential (6 reads)", await measure(sequential, iterations))
+    report("QueryPlan (6 reads)", await measure(concurrent, iterations))
+
+@scenario
+async def bulk_ingest(records=2000):
+    """Per-record POST /energy handler vs one /ingest batch"""
+    import server
+
+    await server.client.drop_database(os.environ["DB_NAME"])
+    await server.ensure_indexes()
+
+    started = time.perf_counter()
+    for i in range(records):
+        await server.log_energy_level(server.EnergyLevelCreate(level=i % 10 + 1))
+    single = time.perf_counter() - started
+
+    items = [{"type": "energy", "level": i % 10 + 1} for i in range(records)]
+    started = time.perf_counter()
+    results = await server.ingest_records(items)
+    batched = time.perf_counter() - started
+
+    assert all(result["status"] == "created" for result in results)
+    print(f"   insert_one x{records:<6} {single * 1e6 / records:8.1f} us/record")
+    print(f"   /ingest batch {records:<6} {batched * 1e6 / records:8.1f} us/record ({single / batched:.1f}x)")
+
+@scenario
+async def write_buffer(seconds=5.0, writers=50):
+    """Sustained POST /energy throughput for each WRITE_BUFFER_MODE"""
+    import server
+
+    for mode in ("off", "buffered", "group_commit"):
+        await server.client.drop_database(os.environ["DB_NAME"])
+        await server.ensure_indexes()
+        server.write_buffer = server.WriteBuffer(mode=mode)
+        await server.write_buffer.start()
+        written = 0
+        deadline = time.perf_counter() + seconds
+
+        async def writer():
+            nonlocal written
+            while time.perf_counter() < deadline:
+                await server.log_energy_level(server.EnergyLevelCreate(level=7))
+                written += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(writer() for _ in range(writers)))
+        await server.write_buffer.stop()
+        elapsed = time.perf_counter() - started
+        stored = await server.db.energy_levels.count_documents({})
+        print(f"   {mode:<14} {written / elapsed:8.0f} inserts/s   stored {stored}/{written}")
+
+@scenario
+async def recommended_tasks(pending=1_000_000, iterations=500):
+    """Top-5 recommendation query over a large backlog of pending tasks"""
+    import server
+
+    await server.client.drop_database(os.environ["DB_NAME"])
+    await server.ensure_indexes()
+    now = datetime.now(timezone.utc)
+    priorities = list(server.PRIORITY_RANKS.items())
+    for start in range(0, pending, 10000):
+        await server.db.tasks.insert_many([
+            {
+                "id": str(uuid.uuid4()), "title": f"Task {i}", "energy_requirement": i % 10 + 1,
+                "estimated_duration": 30, "priority": priorities[i % 3][0], "priority_rank": priorities[i % 3][1],
+                "completed": False, "created_at": now - timedelta(seconds=i)
+            }
+            for i in range(start, min(start + 10000, pending))
+        ])
+
+    async def recommend():
+        await server.get_recommended_tasks()
+
+    await measure(recommend, 20)
+    samples = await measure(recommend, iterations)
+    report(f"get_recommended_tasks ({pending} pending)", samples)
+    p95 = sorted(samples)[int(len(samples) * 0.95)] * 1000
+    print(f"   p95 {'within' if p95 < 2 else 'OVER'} the 2 ms budget")
+
+@scenario
+async def schedule_planner(iterations=50):
+    """plan_day over growing backlogs with the default energy curve"""
+    import random
+    from scheduler import DEFAULT_ENERGY_CURVE, plan_day
+
+    rng = random.Random(7)
+    day_start = datetime.now(timezone.utc).replace(hour=6, minute=0, second=0, microsecond=0)
+    day_end = day_start.replace(hour=22)
+    for size in (100, 1000, 5000, 20000):
+        tasks = [
+            {
+                "id": str(i), "title": f"Task {i}", "energy_requirement": rng.randint(1, 10),
+                "estimated_duration": rng.choice([5, 15, 25, 45, 90, 180]),
+                "priority": rng.choice(["high", "medium", "low"]),
+                "created_at": day_start - timedelta(minutes=i)
+            }
+            for i in range(size)
+        ]
+
+        async def plan():
+            plan_day(tasks, DEFAULT_ENERGY_CURVE, day_start, day_end)
+
+        report(f"plan_day ({size} tasks)", await measure(plan, iterations))
+
+@scenario
+async def analytics_core(readings=100_000, iterations=20):
+    """Python generator sums vs the NumPy analytics module over a full energy history"""
+    import analytics
+
+    now = datetime.now(timezone.utc)
+    docs = [
+        {"level": i % 10 + 1, "timestamp": now - timedelta(minutes=i), "epoch_ms": int(now.timestamp() * 1000) - i * 60000}
+        for i in range(readings)
+    ]
+
+    async def python_loops():
+        levels = [d["level"] for d in docs]
+        mean = sum(levels) / len(levels)
+        sum((level - mean) ** 2 for level in levels) / len(levels)
+        by_hour = {}
+        for d in docs:
+            by_hour.setdefault(d["timestamp"].hour, []).append(d["level"])
+        max(by_hour, key=lambda hour: sum(by_hour[hour]) / len(by_hour[hour]))
+
+    async def vectorized():
+        levels = analytics.column(docs, "level")
+        analytics.summary(levels)
+        analytics.peak_hour(analytics.hours(analytics.epochs(docs)), levels)
+
+    report(f"python loops ({readings} readings)", await measure(python_loops, iterations))
+    report(f"analytics module ({readings} readings)", await measure(vectorized, iterations))
+
+@scenario
+async def projected_reads(iterations=200):
+    """Whole documents vs repository projections for the productivity-genetics read set"""
+    import bson
+    import server
+
+    await server.client.drop_database(os.environ["DB_NAME"])
+    await seed_collections(server.db)
+    await server.ensure_indexes()
+    db = server.db
+
+    async def full():
+        return [
+            await db.energy_levels.find().sort("timestamp", -1).limit(100).to_list(100),
+            await db.tasks.find().sort("created_at", -1).limit(50).to_list(50),
+            await db.focus_sessions.find().sort("started_at", -1).limit(30).to_list(30)
+        ]
+
+    async def projected():
+        return [
+            await server.energy_repo.recent(["level", "timestamp"], 100),
+            await server.tasks_repo.recent(["priority", "energy_requirement", "completed"], 50),
+            await server.focus_repo.recent(["duration", "productivity_rating"], 30)
+        ]
+
+    for name, read in (("whole documents", full), ("repository projections", projected)):
+        size = sum(len(bson.encode(doc)) for docs in await read() for doc in docs)
+        report(f"{name} ({size} bytes)", await measure(read, iterations))
+
+@scenario
+async def tenant_scaling(user_counts=(10, 100, 1000), energy=200, tasks=100, iterations=200):
+    """Per-user reads as the number of users sharing the collections grows"""
+    import random
+    import server
+
+    await server.client.drop_database(os.environ["DB_NAME"])
+    await server.ensure_indexes()
+    now = datetime.now(timezone.utc)
+    seeded = 0
+    for users in user_counts:
+        for n in range(seeded, users):
+            user_id = f"user-{n}"
+            await server.mongo_db.energy_levels.insert_many([
+                {"id": str(uuid.uuid4()), "user_id": user_id, "level": i % 10 + 1, "timestamp": now - timedelta(minutes=i)}
+                for i in range(energy)
+            ])
+            await server.mongo_db.tasks.insert_many([
+                {
+                    "id": str(uuid.uuid4()), "user_id": user_id, "title": f"Task {i}", "energy_requirement": i % 10 + 1,
+                    "estimated_duration": 30, "priority": "medium", "priority_rank": 1,
+                    "completed": i % 4 == 0, "created_at": now - timedelta(minutes=i)
+                }
+                for i in range(tasks)
+            ])
+        seeded = users
+        rng = random.Random(users)
+
+        async def user_reads():
+            with server.tenant(f"user-{rng.randrange(users)}"):
+                await server.db.energy_levels.find({}, {"_id": 0}).sort("timestamp", -1).limit(20).to_list(20)
+                await server.db.tasks.find({"completed": False}, {"_id": 0}).sort("created_at", -1).limit(50).to_list(50)
+                await server.db.tasks.count_documents({"completed": True})
+
+        await measure(user_reads, 20)
+        report(f"history + tasks + count ({users} users)", await measure(user_reads, iterations))
+
+@scenario
+async def list_serialization(iterations=20):
+    """GET /tasks body encoding: Task models + jsonable_encoder vs projected dicts + orjson"""
+    from bson import ObjectId
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    import server
+
+    now = datetime.now(timezone.utc)
+    for size in (100, 1000, 10000):
+        projected = [
+            {
+                "id": str(uuid.uuid4()), "title": f"Task {i}", "description": None,
+                "energy_requirement": i % 10 + 1, "estimated_duration": 30, "priority": "medium",
+                "category": None, "completed": False, "created_at": now - timedelta(minutes=i), "completed_at": None
+            }
+            for i in range(size)
+        ]
+        # What the database returns without a projection
+        stored = [{"_id": ObjectId(), "user_id": "default", "priority_rank": 1, **doc} for doc in projected]
+
+        async def models():
+            JSONResponse(jsonable_encoder([server.Task(**doc) for doc in stored])).body
+
+        async def fast():
+            server.fast_list_response(projected, None, server.TASK_DEFAULTS).body
+
+        report(f"Task models + jsonable_encoder ({size})", await measure(models, iterations))
+        report(f"projection + orjson ({size})", await measure(fast, iterations))
+
+def recursive_walk(data):
+    """The recursive ObjectId walk that prepare_from_mongo used before codec.py"""
+    from bson import ObjectId
+    if isinstance(data, dict):
+        if '_id' in data:
+            del data['_id']
+        for key, value in data.items():
+            if isinstance(value, ObjectId):
+                data[key] = str(value)
+            elif isinstance(value, list):
+                data[key] = [recursive_walk(item) if isinstance(item, dict) else str(item) if isinstance(item, ObjectId) else item for item in value]
+            elif isinstance(value, dict):
+                data[key] = recursive_walk(value)
+    return data
+
+@scenario
+async def document_codec(documents=10000, iterations=20):
+    """Stored task documents -> API dicts: recursive walk vs the compiled codec"""
+    from bson import ObjectId
+    from codec import CODECS
+
+    now = datetime.now(timezone.utc)
+    template = [
+        {
+            "_id": ObjectId(), "user_id": "default", "id": str(uuid.uuid4()), "title": f"Task {i}",
+            "description": None, "energy_requirement": i % 10 + 1, "estimated_duration": 30,
+            "priority": "medium", "priority_rank": 1, "category": None, "completed": False,
+            "created_at": now - timedelta(minutes=i), "completed_at": None
+        }
+        for i in range(documents)
+    ]
+    codec = CODECS["tasks"]
+    for name, convert in (("recursive walk", lambda docs: [recursive_walk(doc) for doc in docs]), ("codec", codec.decode_many)):
+        samples = []
+        for _ in range(iterations):
+            docs = [dict(doc) for doc in template]
+            started = time.perf_counter()
+            convert(docs)
+            samples.append(time.perf_counter() - started)
+        report(f"{name} ({documents} docs)", samples)
+        print(f"   {'':<40} {statistics.median(samples) * 1e6 / documents:.2f} us/doc")
+
+async def run_scenarios(names):
+    # One event loop for every scenario so the shared Motor client stays bound
+    for name in names:
+        print(f"\n🏁 {name}: {SCENARIOS[name].__doc__}")
+        await SCENARIOS[name]()
+
+@scenario
+async def llm_burst(requests=200, concurrency=8):
+    """Burst of AI requests through LLMClientPool against a local fake LLM server"""
+    import server
+    from tests.fake_llm import start_fake_llm_server
+
+    fake, base_url, fake_stats = await start_fake_llm_server()
+    pool = server.LLMClientPool(max_concurrency=concurrency, max_queue=requests, base_url=base_url)
+    await pool.start()
+    peak_in_flight = 0
+
+    async def one():
+        nonlocal peak_in_flight
+        task = asyncio.create_task(pool.send("How do I focus?", session_prefix="bench"))
+        await asyncio.sleep(0)
+        peak_in_flight = max(peak_in_flight, pool.stats["in_flight"])
+        return await task
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    await pool.close()
+    fake.close()
+    await fake.wait_closed()
+
+    print(f"   {requests} requests in {elapsed:.2f}s ({requests / elapsed:.0f} req/s)")
+    print(f"   upstream connections opened: {fake_stats['connections']} (limit {concurrency})")
+    print(f"   peak in flight: {peak_in_flight}, peak queued: {pool.stats['max_queued']}")
+    print(f"   mean queue wait: {pool.stats['wait_seconds_total'] / requests * 1000:.1f} ms")
+
+def main(argv):
+    selected = argv or list(SCENARIOS)
+    unknown = [name for name in selected if name not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenario(s) {', '.join(unknown)}. Available: {', '.join(SCENARIOS)}")
+        return 1
+    asyncio.run(run_scenarios(selected))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,48 @@
+"""Local OpenAI-compatible LLM server for exercising LLMClientPool without a real provider"""
+import asyncio
+import json
+
+
+async def start_fake_llm_server(delay=0.05):
+    """Minimal /chat/completions server with keep-alive
+
+    Returns the asyncio server, its base URL and a stats dict counting
+    connections, requests and the most requests handled at the same time.
+    """
+    stats = {"connections": 0, "requests": 0, "active": 0, "max_active": 0}
+
+    async def handle(reader, writer):
+        stats["connections"] += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode().split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                await reader.readexactly(length)
+                stats["requests"] += 1
+                stats["active"] += 1
+                stats["max_active"] = max(stats["max_active"], stats["active"])
+                try:
+                    await asyncio.sleep(delay)
+                finally:
+                    stats["active"] -= 1
+                body = json.dumps({
+                    "choices": [{"message": {"role": "assistant", "content": "Take a 5 minute break."}}],
+                    "usage": {"prompt_tokens": 120, "completion_tokens": 8}
+                }).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}", stats
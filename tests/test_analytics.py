@@ -0,0 +1,115 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import analytics  # noqa: E402
+
+HOUR = 3600
+
+
+def test_column_fills_missing_values():
+    docs = [{"level": 4}, {}, {"level": None}, {"level": 7}]
+    assert np.isnan(analytics.column(docs, "level")).tolist() == [False, True, True, False]
+    assert analytics.column(docs, "level", default=0).tolist() == [4, 0, 0, 7]
+
+
+def test_epochs_and_hours():
+    docs = [{"epoch_ms": 5 * HOUR * 1000}, {"epoch_ms": (24 + 23) * HOUR * 1000 + 1}, {}]
+    timestamps = analytics.epochs(docs)
+    assert analytics.hours(timestamps).tolist() == [5, 23, -1]
+
+
+def test_summary_matches_numpy_and_ignores_nan():
+    values = np.array([3.0, np.nan, 5.0, 9.0, 1.0])
+    result = analytics.summary(values)
+    known = values[~np.isnan(values)]
+    assert result == {
+        "count": 4, "mean": known.mean(), "variance": known.var(), "std": known.std(), "min": 1.0, "max": 9.0
+    }
+    assert analytics.summary(np.array([np.nan]))["mean"] is None
+
+
+def test_rolling_mean():
+    assert analytics.rolling_mean(np.array([1.0, 2.0, 3.0, 4.0]), 2).tolist() == [1.5, 2.5, 3.5]
+    assert analytics.rolling_mean(np.array([1.0]), 2).size == 0
+
+
+def test_rolling_mean_skips_windows_with_missing_values():
+    means = analytics.rolling_mean(np.array([1.0, np.nan, 3.0, 4.0, 5.0, np.nan]), 2)
+    assert np.isnan(means).tolist() == [True, True, False, False, True]
+    assert means[2:4].tolist() == [3.5, 4.5]
+
+
+def test_rolling_mean_over_a_partial_day():
+    # Readings only between 08:00 and 18:00, as for a user who does not log overnight
+    profile = np.full(24, np.nan)
+    profile[8:18] = [5, 6, 8, 9, 8, 6, 4, 3, 4, 5]
+    means = analytics.rolling_mean(profile, 3)
+    assert np.nanargmax(means) == 10 and means[10] == pytest.approx(25 / 3)
+    assert np.nanargmin(means) == 14 and means[14] == pytest.approx(11 / 3)
+    assert np.isnan(means[:8]).all() and np.isnan(means[16:]).all()
+
+
+def test_pooled_summary_equals_summary_of_the_union():
+    groups = [np.array([2.0, 4.0, 9.0]), np.array([5.0]), np.array([1.0, 1.0, 8.0, 6.0])]
+    pooled = analytics.pooled_summary(
+        np.array([group.size for group in groups], dtype=float),
+        np.array([group.sum() for group in groups]),
+        np.array([(group ** 2).sum() for group in groups]),
+        np.array([group.min() for group in groups]),
+        np.array([group.max() for group in groups]),
+    )
+    expected = analytics.summary(np.concatenate(groups))
+    assert pooled.keys() == expected.keys()
+    for key in expected:
+        assert pooled[key] == pytest.approx(expected[key])
+    assert analytics.pooled_summary(np.zeros(2), np.zeros(2), np.zeros(2))["count"] == 0
+
+
+def test_hourly_profile_and_peak_hour():
+    hour_of_day = np.array([9, 9, 9, 14, 14, 14, 20, -1])
+    values = np.array([8.0, 9.0, 7.0, 4.0, 5.0, 3.0, 10.0, 10.0])
+    counts, means = analytics.hourly_profile(hour_of_day, values)
+    assert counts[9] == 3 and means[9] == pytest.approx(8.0)
+    assert counts[20] == 1 and np.isnan(means[0])
+    # Hour 20 has the best mean but too few readings; the missing timestamp is ignored
+    assert analytics.peak_hour(hour_of_day, values) == 9
+    assert analytics.peak_hour(hour_of_day, values, min_readings=1) == 20
+    assert analytics.peak_hour(np.array([3]), np.array([5.0])) is None
+
+
+def test_hourly_totals_weights_grouped_counts():
+    counts, means = analytics.hourly_totals(np.array([7, 7, 8]), np.array([2.0, 2.0, 5.0]), np.array([10.0, 14.0, 15.0]))
+    assert counts[7] == 4 and means[7] == pytest.approx(6.0)
+    assert means[8] == pytest.approx(3.0)
+
+
+def test_correlation():
+    x = np.array([1.0, 2.0, 3.0, 4.0, np.nan])
+    assert analytics.correlation(x, np.array([2.0, 4.0, 6.0, 8.0, 1.0])) == pytest.approx(1.0)
+    assert analytics.correlation(x, np.array([8.0, 6.0, 4.0, 2.0, 1.0])) == pytest.approx(-1.0)
+    assert analytics.correlation(x, np.full(5, 3.0)) is None
+    assert analytics.correlation(np.array([1.0, 2.0]), np.array([1.0, 2.0])) is None
+
+
+def test_energy_at_uses_latest_earlier_reading():
+    energy_times = np.array([300.0, 100.0, 200.0])
+    energy_levels = np.array([9.0, 3.0, 6.0])
+    result = analytics.energy_at(energy_times, energy_levels, np.array([50.0, 100.0, 250.0, 1000.0, np.nan]))
+    assert np.isnan(result[0]) and np.isnan(result[4])
+    assert result[1:4].tolist() == [3.0, 6.0, 9.0]
+
+
+def test_energy_completion_correlation():
+    energy_times = np.array([0.0, 100.0, 200.0, 300.0])
+    energy_levels = np.array([2.0, 8.0, 3.0, 9.0])
+    task_times = np.array([10.0, 110.0, 210.0, 310.0])
+    completed = np.array([0.0, 1.0, 0.0, 1.0])
+    assert analytics.energy_completion_correlation(energy_times, energy_levels, task_times, completed) == pytest.approx(
+        np.corrcoef([2.0, 8.0, 3.0, 9.0], completed)[0, 1]
+    )
+    assert analytics.energy_completion_correlation(np.empty(0), np.empty(0), task_times, completed) is None
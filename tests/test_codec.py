@@ -0,0 +1,71 @@
+import sys
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import bson
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from codec import CODECS, DATETIME_FIELDS, DocumentCodec  # noqa: E402
+
+STORED = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+NOW = datetime(2025, 3, 14, 9, 26, 53, 589000, tzinfo=timezone.utc)
+
+
+def api_task(**overrides):
+    return {
+        "id": "task-1", "title": "Write report", "description": None, "energy_requirement": 7,
+        "estimated_duration": 45, "priority": "high", "category": "work", "completed": True,
+        "created_at": NOW, "completed_at": NOW + timedelta(hours=2), **overrides
+    }
+
+
+def stored_native(doc, **internal):
+    """What Motor returns for a document written with native BSON dates"""
+    return bson.decode(bson.encode({"_id": ObjectId(), "user_id": "alice", **internal, **doc}), STORED)
+
+
+def stored_iso(doc, collection_name):
+    """What Motor returns for a document written before the datetime migration"""
+    legacy = {key: value.isoformat() if key in DATETIME_FIELDS[collection_name] and value else value for key, value in doc.items()}
+    return stored_native(legacy)
+
+
+def test_native_round_trip():
+    assert CODECS["tasks"].decode(stored_native(api_task(), priority_rank=0)) == api_task()
+
+
+def test_iso_round_trip():
+    assert CODECS["tasks"].decode(stored_iso(api_task(), "tasks")) == api_task()
+
+
+def test_z_suffix_and_missing_datetimes():
+    doc = stored_native(api_task(completed=False, completed_at=None, created_at="2025-03-14T09:26:53.589Z"))
+    assert CODECS["tasks"].decode(doc) == api_task(completed=False, completed_at=None)
+
+
+def test_every_collection_round_trips():
+    for collection_name, fields in DATETIME_FIELDS.items():
+        doc = {"id": f"{collection_name}-1", "value": 3, **{field: NOW for field in fields}}
+        codec = CODECS[collection_name]
+        assert codec.decode(stored_native(doc)) == doc
+        assert codec.decode(stored_iso(doc, collection_name)) == doc
+
+
+def test_unparseable_datetime_string_is_kept():
+    doc = stored_native({"id": "e-1", "level": 5, "timestamp": "yesterday"})
+    assert CODECS["energy_levels"].decode(doc)["timestamp"] == "yesterday"
+
+
+def test_object_id_and_nested_fields():
+    owner, inner = ObjectId(), ObjectId()
+    codec = DocumentCodec(object_id_fields=("owner",), nested_fields=("result",))
+    doc = codec.decode({"_id": ObjectId(), "owner": owner, "result": {"_id": ObjectId(), "refs": [inner, {"ref": inner}]}})
+    assert doc == {"owner": str(owner), "result": {"refs": [str(inner), {"ref": str(inner)}]}}
+
+
+def test_decode_many():
+    docs = [stored_native(api_task(id=f"task-{i}")) for i in range(3)]
+    assert CODECS["tasks"].decode_many(docs) == [api_task(id=f"task-{i}") for i in range(3)]
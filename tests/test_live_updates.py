@@ -0,0 +1,72 @@
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "zentask_test")
+pytest.importorskip("emergentintegrations")
+
+import server  # noqa: E402
+
+NOW = datetime(2025, 3, 14, 9, 30, tzinfo=timezone.utc)
+
+
+def task_document(user_id):
+    return {
+        "_id": ObjectId(), "user_id": user_id, "id": "task-1", "title": "Write report", "energy_requirement": 6,
+        "estimated_duration": 30, "priority": "high", "priority_rank": 0, "completed": False, "created_at": NOW
+    }
+
+
+def change(operation, user_id):
+    event = {"operationType": operation, "ns": {"db": "zentask", "coll": "tasks"}, "fullDocument": task_document(user_id)}
+    if operation == "update":
+        event["updateDescription"] = {"updatedFields": {"completed": True}, "removedFields": []}
+    return event
+
+
+def subscribed(live, user_id, collections=("tasks",)):
+    """A subscriber queue registered without starting the change stream"""
+    queue = asyncio.Queue(maxsize=live.queue_size)
+    live.subscribers[queue] = (user_id, set(collections))
+    return queue
+
+
+@pytest.mark.parametrize("operation", ["insert", "replace", "update"])
+def test_change_reaches_its_owner_only(operation):
+    live = server.LiveUpdates()
+    alice, bob = subscribed(live, "alice"), subscribed(live, "bob")
+    live.dispatch(change(operation, "alice"))
+    assert alice.qsize() == 1
+    assert bob.qsize() == 0
+    message = alice.get_nowait()
+    assert message["type"] == operation
+    if operation == "update":
+        assert message == {"type": "update", "collection": "tasks", "id": "task-1", "fields": {"completed": True}}
+    else:
+        assert message["document"]["title"] == "Write report"
+        assert "user_id" not in message["document"] and "_id" not in message["document"]
+
+
+def test_unsubscribed_collection_is_skipped():
+    live = server.LiveUpdates()
+    moods_only = subscribed(live, "alice", collections=("mood_states",))
+    live.dispatch(change("insert", "alice"))
+    assert moods_only.empty()
+
+
+def test_live_token_round_trip(monkeypatch):
+    monkeypatch.setattr(server, "LIVE_TOKEN_SECRET", "test-secret")
+    token = server.issue_live_token("alice")
+    assert server.verify_live_token(token) == "alice"
+    payload, _, signature = token.partition(".")
+    assert server.verify_live_token(f"{payload}.{'0' * len(signature)}") is None
+    assert server.verify_live_token("not-a-token") is None
+    monkeypatch.setattr(server, "LIVE_TOKEN_TTL", -1)
+    assert server.verify_live_token(server.issue_live_token("alice")) is None
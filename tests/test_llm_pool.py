@@ -0,0 +1,71 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "zentask_test")
+pytest.importorskip("emergentintegrations")
+
+import server  # noqa: E402
+
+from tests.fake_llm import start_fake_llm_server  # noqa: E402
+
+
+def run_against_fake(scenario, delay=0.05, **pool_options):
+    """Run scenario(pool, stats) with a started pool pointed at a fresh fake server"""
+    async def main():
+        fake, base_url, stats = await start_fake_llm_server(delay)
+        pool = server.LLMClientPool(base_url=base_url, **pool_options)
+        await pool.start()
+        try:
+            return await scenario(pool, stats)
+        finally:
+            await pool.close()
+            fake.close()
+            await fake.wait_closed()
+
+    return asyncio.run(main())
+
+
+def test_concurrency_is_capped():
+    async def burst(pool, stats):
+        responses = await asyncio.gather(*(pool.send("How do I focus?") for _ in range(20)))
+        assert responses == ["Take a 5 minute break."] * 20
+        assert stats["requests"] == 20
+        assert stats["max_active"] == 3
+        assert pool.stats["max_queued"] > 0
+        assert pool.stats["in_flight"] == 0
+
+    run_against_fake(burst, max_concurrency=3, max_queue=100)
+
+
+def test_full_queue_is_rejected_with_503():
+    async def overload(pool, stats):
+        running = asyncio.create_task(pool.send("first"))
+        waiting = asyncio.create_task(pool.send("second"))
+        while pool.stats["in_flight"] < 1 or pool.stats["queued"] < 1:
+            await asyncio.sleep(0.001)
+        with pytest.raises(HTTPException) as rejected:
+            await pool.send("third")
+        assert rejected.value.status_code == 503
+        assert pool.stats["rejected"] == 1
+        await asyncio.gather(running, waiting)
+        assert stats["requests"] == 2
+
+    run_against_fake(overload, delay=0.2, max_concurrency=1, max_queue=1)
+
+
+def test_connection_is_reused():
+    async def sequential(pool, stats):
+        for _ in range(5):
+            await pool.send("How do I focus?")
+        assert stats["requests"] == 5
+        assert stats["connections"] == 1
+        assert pool.stats["prompt_tokens"] == 5 * 120
+
+    run_against_fake(sequential, max_concurrency=4)
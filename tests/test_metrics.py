@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import metrics  # noqa: E402
+
+
+def test_summary_renders_quantiles_sum_and_count():
+    registry = metrics.Registry(window=100)
+    latency = registry.summary("zentask_latency_seconds", "Request latency", ("route",))
+    for value in range(1, 101):
+        latency.observe(value / 100, "/api/tasks")
+    lines = registry.render().splitlines()
+    assert lines == [
+        "# HELP zentask_latency_seconds Request latency",
+        "# TYPE zentask_latency_seconds summary",
+        'zentask_latency_seconds{route="/api/tasks",quantile="0.5"} 0.51',
+        'zentask_latency_seconds{route="/api/tasks",quantile="0.95"} 0.96',
+        'zentask_latency_seconds{route="/api/tasks",quantile="0.99"} 1.0',
+        f'zentask_latency_seconds_sum{{route="/api/tasks"}} {sum(v / 100 for v in range(1, 101))!r}',
+        'zentask_latency_seconds_count{route="/api/tasks"} 100.0',
+    ]
+
+
+def test_quantiles_cover_the_window_but_totals_cover_everything():
+    registry = metrics.Registry(window=2)
+    latency = registry.summary("latency", "Latency")
+    for value in (100.0, 1.0, 2.0):
+        latency.observe(value)
+    text = registry.render()
+    assert 'latency{quantile="0.99"} 2.0' in text
+    assert "latency_sum 103.0" in text
+    assert "latency_count 3.0" in text
+
+
+def test_counter_labels_are_escaped():
+    registry = metrics.Registry()
+    requests = registry.counter("requests_total", "Requests", ("route", "status"))
+    requests.inc('/say "hi"\\now', "200")
+    requests.inc('/say "hi"\\now', "200", amount=2)
+    requests.inc("/multi\nline", "500")
+    lines = registry.render().splitlines()
+    assert lines[1] == "# TYPE requests_total counter"
+    assert 'requests_total{route="/say \\"hi\\"\\\\now",status="200"} 3.0' in lines
+    assert 'requests_total{route="/multi\\nline",status="500"} 1.0' in lines
+
+
+def test_collectors_are_read_at_render_time():
+    registry = metrics.Registry()
+    stats = {"queued": 1}
+    registry.collector(lambda: [("pool_queued", "Waiting calls", "gauge", [({}, stats["queued"])])])
+    assert registry.render() == "# HELP pool_queued Waiting calls\n# TYPE pool_queued gauge\npool_queued 1.0\n"
+    stats["queued"] = 4
+    assert "pool_queued 4.0" in registry.render()
+
+
+def test_families_without_observations_render_only_headers():
+    registry = metrics.Registry()
+    registry.summary("idle_seconds", "Nothing yet")
+    assert registry.render() == "# HELP idle_seconds Nothing yet\n# TYPE idle_seconds summary\n"
@@ -0,0 +1,104 @@
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from scheduler import DEFAULT_ENERGY_CURVE, plan_day  # noqa: E402
+
+DAY = datetime(2025, 3, 14, tzinfo=timezone.utc)
+FLAT_CURVE = [7] * 24
+
+
+def task(task_id, requirement=5, duration=30, priority="medium", age_minutes=0):
+    return {
+        "id": task_id, "title": task_id, "energy_requirement": requirement, "estimated_duration": duration,
+        "priority": priority, "created_at": DAY - timedelta(minutes=age_minutes)
+    }
+
+
+def lowest_energy(curve, start, end):
+    """Lowest curve value over every minute of [start, end)"""
+    return min(curve[(start + timedelta(minutes=minute)).hour] for minute in range(int((end - start).total_seconds() // 60)))
+
+
+def test_blocks_never_dip_below_requirement():
+    rng = random.Random(7)
+    tasks = [
+        task(f"t{i}", requirement=rng.randint(1, 9), duration=rng.choice([15, 30, 45, 90, 150]),
+             priority=rng.choice(["high", "medium", "low"]), age_minutes=rng.randint(0, 10000))
+        for i in range(60)
+    ]
+    plan = plan_day(tasks, DEFAULT_ENERGY_CURVE, DAY.replace(hour=5), DAY.replace(hour=22))
+    assert plan["blocks"]
+    for block in plan["blocks"]:
+        assert lowest_energy(DEFAULT_ENERGY_CURVE, block["start"], block["end"]) >= block["energy_requirement"]
+        assert block["predicted_energy"] >= block["energy_requirement"]
+    assert plan["scheduled"] + len(plan["unscheduled"]) == len(tasks)
+
+
+def test_ordered_by_priority_then_age():
+    tasks = [
+        task("low-old", priority="low", age_minutes=500),
+        task("high-new", priority="high", age_minutes=10),
+        task("medium", priority="medium", age_minutes=100),
+        task("high-old", priority="high", age_minutes=300),
+    ]
+    plan = plan_day(tasks, FLAT_CURVE, DAY.replace(hour=9), DAY.replace(hour=17))
+    assert [block["task_id"] for block in plan["blocks"]] == ["high-old", "high-new", "medium", "low-old"]
+
+
+def test_priority_rank_overrides_label():
+    tasks = [task("labelled-high", priority="high"), {**task("ranked-first", priority="low"), "priority_rank": -1}]
+    plan = plan_day(tasks, FLAT_CURVE, DAY.replace(hour=9), DAY.replace(hour=17))
+    assert [block["task_id"] for block in plan["blocks"]] == ["ranked-first", "labelled-high"]
+
+
+def test_too_long_or_too_demanding_tasks_are_unscheduled():
+    tasks = [
+        task("fits", duration=60),
+        task("longer-than-day", duration=300),
+        task("above-peak", requirement=10),
+        task("no-room-left", duration=150, priority="low"),
+    ]
+    plan = plan_day(tasks, DEFAULT_ENERGY_CURVE, DAY.replace(hour=6), DAY.replace(hour=9, minute=30))
+    assert [block["task_id"] for block in plan["blocks"]] == ["fits"]
+    assert sorted(plan["unscheduled"]) == ["above-peak", "longer-than-day", "no-room-left"]
+
+
+def test_breaks_between_blocks():
+    tasks = [task(f"t{i}", duration=25) for i in range(6)]
+    plan = plan_day(tasks, FLAT_CURVE, DAY.replace(hour=9), DAY.replace(hour=17), break_minutes=10)
+    blocks = plan["blocks"]
+    assert len(blocks) == 6
+    assert blocks[0]["start"] == DAY.replace(hour=9)
+    for previous, following in zip(blocks, blocks[1:]):
+        assert following["start"] - previous["end"] >= timedelta(minutes=10)
+    assert blocks[-1]["end"] <= DAY.replace(hour=17)
+
+
+def test_waits_for_energy_to_rise():
+    plan = plan_day([task("demanding", requirement=8, duration=60)], DEFAULT_ENERGY_CURVE, DAY.replace(hour=3), DAY.replace(hour=12))
+    assert plan["blocks"][0]["start"] == DAY.replace(hour=6)
+    assert plan["utilization"] == round(60 / (9 * 60), 3)
+
+
+def test_curve_follows_the_local_clock():
+    pacific = ZoneInfo("America/Los_Angeles")
+    day = datetime(2025, 6, 2, tzinfo=pacific)
+    plan = plan_day([task("demanding", requirement=8, duration=60)], DEFAULT_ENERGY_CURVE, day.replace(hour=3), day.replace(hour=12))
+    block = plan["blocks"][0]
+    assert block["start"] == day.replace(hour=6)
+    assert block["start"].tzinfo == pacific and block["start"].hour == 6
+
+
+def test_durations_are_exact_across_dst():
+    # Clocks in New York jump from 02:00 to 03:00 on 2025-03-09
+    eastern = ZoneInfo("America/New_York")
+    day = datetime(2025, 3, 9, tzinfo=eastern)
+    plan = plan_day([task("overnight", requirement=1, duration=90)], FLAT_CURVE, day.replace(hour=1), day.replace(hour=6))
+    block = plan["blocks"][0]
+    assert block["end"].astimezone(timezone.utc) - block["start"].astimezone(timezone.utc) == timedelta(minutes=90)
+    assert (block["start"].hour, block["end"].hour, block["end"].minute) == (1, 3, 30)
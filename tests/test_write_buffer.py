@@ -0,0 +1,68 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "zentask_test")
+pytest.importorskip("emergentintegrations")
+
+import server  # noqa: E402
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+
+    async def insert_many(self, docs, ordered=True):
+        self.docs.extend(docs)
+
+
+def test_flusher_survives_failed_derived_updates(monkeypatch):
+    collections = {"energy_levels": FakeCollection()}
+    calls = []
+
+    async def record_writes(collection_name, docs):
+        calls.append(len(docs))
+        if len(calls) == 1:
+            raise RuntimeError("counter update timed out")
+
+    monkeypatch.setattr(server, "mongo_db", collections)
+    monkeypatch.setattr(server, "record_writes", record_writes)
+
+    async def main():
+        buffer = server.WriteBuffer(mode="group_commit", max_batch=100, flush_seconds=0.01)
+        await buffer.start()
+        try:
+            await asyncio.wait_for(buffer.add("energy_levels", {"id": "e1", "level": 5}), 1)
+            # The flusher is still running after record_writes failed
+            await asyncio.wait_for(buffer.add("energy_levels", {"id": "e2", "level": 6}), 1)
+            assert not buffer.task.done()
+        finally:
+            await buffer.stop()
+
+    asyncio.run(main())
+    assert [doc["id"] for doc in collections["energy_levels"].docs] == ["e1", "e2"]
+    assert calls == [1, 1]
+
+
+def test_size_triggered_flushes_are_tracked(monkeypatch):
+    collections = {"tasks": FakeCollection()}
+
+    async def record_writes(collection_name, docs):
+        pass
+
+    monkeypatch.setattr(server, "mongo_db", collections)
+    monkeypatch.setattr(server, "record_writes", record_writes)
+
+    async def main():
+        buffer = server.WriteBuffer(mode="group_commit", max_batch=2, flush_seconds=60)
+        await asyncio.wait_for(asyncio.gather(*(buffer.add("tasks", {"id": f"t{i}"}) for i in range(2))), 1)
+        await asyncio.sleep(0)
+        assert not buffer.flushes
+
+    asyncio.run(main())
+    assert len(collections["tasks"].docs) == 2